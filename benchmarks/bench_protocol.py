@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Parser and serializer throughput for each StompProtocol implementation.
+
+    PYTHONPATH=. python benchmarks/bench_protocol.py
+"""
+from __future__ import print_function
+
+import timeit
+
+from torstomp import protocol
+
+FRAMES_PER_CHUNK = 500
+
+MESSAGE = (
+    b'MESSAGE\n'
+    b'subscription:1\n'
+    b'message-id:ID:broker-1234-1\n'
+    b'destination:/queue/telemetry\n'
+    b'content-type:application/json\n'
+    b'\n'
+    b'{"sensor":1,"value":20.5}\x00'
+)
+
+HEADERS = {
+    'destination': '/queue/telemetry',
+    'content-type': 'application/json',
+    'content-length': 25,
+}
+
+BODY = b'{"sensor":1,"value":20.5}'
+
+
+def implementations():
+    yield 'python', protocol.PyStompProtocol
+
+    if protocol._speedups is not None:
+        yield 'c', protocol.CStompProtocol
+
+
+def best_of(function, number):
+    return min(timeit.repeat(function, number=number, repeat=5)) / number
+
+
+def bench_parse(protocol_class):
+    stomp = protocol_class()
+    chunk = MESSAGE * FRAMES_PER_CHUNK
+
+    def parse():
+        stomp.add_data(chunk)
+        stomp.pop_frames()
+
+    return best_of(parse, 20) / FRAMES_PER_CHUNK
+
+
+def bench_build(protocol_class):
+    stomp = protocol_class()
+
+    def build():
+        stomp.build_frame('SEND', HEADERS, BODY)
+
+    return best_of(build, 10000)
+
+
+def main():
+    for name, protocol_class in implementations():
+        print('%-8s parse: %6.2f us/frame  build: %6.2f us/frame' % (
+            name,
+            bench_parse(protocol_class) * 1e6,
+            bench_build(protocol_class) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Cold start of a fresh interpreter for each torstomp entry point.
+
+    PYTHONPATH=. python benchmarks/bench_startup.py
+"""
+from __future__ import print_function
+
+import subprocess
+import sys
+import time
+
+RUNS = 20
+
+SNIPPETS = [
+    ('python', 'pass'),
+    ('import torstomp', 'import torstomp'),
+    ('publish_once', 'from torstomp import publish_once'),
+    ('TorStomp', 'from torstomp import TorStomp'),
+]
+
+
+def cold_start(code):
+    best = None
+
+    for _ in range(RUNS):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', code])
+        elapsed = time.time() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def main():
+    for name, code in SNIPPETS:
+        print('%-16s %7.1f ms' % (name, cold_start(code) * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""Request/reply round trip over each TorStomp transport.
+
+Every round trip ACKs the previous reply and sends the next request, two
+small writes in a row, like a consumer with ack='client' answering RPCs.
+The broker runs on its own IOLoop in a thread.
+
+    PYTHONPATH=. python benchmarks/bench_transport.py
+"""
+from __future__ import print_function
+
+import asyncio
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
+from tornado.netutil import bind_sockets, bind_unix_socket
+from tornado.tcpserver import TCPServer
+
+from torstomp import TorStomp
+from torstomp.protocol import StompProtocol
+
+ROUND_TRIPS = 200
+
+
+class Broker(TCPServer):
+
+    @gen.coroutine
+    def handle_stream(self, stream, address):
+        protocol = StompProtocol()
+
+        try:
+            while True:
+                data = yield stream.read_bytes(65536, partial=True)
+                protocol.add_data(data)
+
+                for frame in protocol.pop_frames():
+                    if frame.command == 'CONNECT':
+                        yield stream.write(b'CONNECTED\nversion:1.1\n\n\x00')
+                    elif frame.command == 'SEND':
+                        yield stream.write(protocol.build_frame('RECEIPT', {
+                            'receipt-id': frame.headers['receipt']}))
+        except StreamClosedError:
+            pass
+
+
+def start_broker(sockets):
+    started = threading.Event()
+    holder = {}
+
+    def run():
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        holder['loop'] = IOLoop.current()
+        server = Broker()
+        server.add_sockets(sockets)
+        started.set()
+        holder['loop'].start()
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    started.wait()
+
+    return holder['loop']
+
+
+@gen.coroutine
+def round_trips(client):
+    receipts = {}
+
+    def on_receipt(frame):
+        receipts.pop(frame.headers['receipt-id']).set_result(None)
+
+    client.add_frame_handler('RECEIPT', on_receipt)
+    yield client.connect()
+
+    start = time.time()
+
+    for i in range(ROUND_TRIPS):
+        future = receipts[str(i)] = gen.Future()
+
+        client._send_frame('ACK', {'subscription': '1', 'message-id': i})
+        client.send('/queue/rpc', 'ping', headers={'receipt': i})
+
+        yield future
+
+    raise gen.Return((time.time() - start) / ROUND_TRIPS)
+
+
+def bench(name, sockets, **kwargs):
+    broker_loop = start_broker(sockets)
+
+    client = TorStomp(connect_headers={}, **kwargs)
+    elapsed = IOLoop.current().run_sync(lambda: round_trips(client))
+    client.stream.close()
+
+    broker_loop.add_callback(broker_loop.stop)
+    print('%-12s %8.1f us/round trip' % (name, elapsed * 1e6))
+
+
+def main():
+    directory = tempfile.mkdtemp()
+
+    try:
+        sockets = bind_sockets(0, '127.0.0.1', family=socket.AF_INET)
+        port = sockets[0].getsockname()[1]
+        bench('tcp', sockets, host='127.0.0.1', port=port)
+
+        sockets = bind_sockets(0, '127.0.0.1', family=socket.AF_INET)
+        port = sockets[0].getsockname()[1]
+        bench('tcp_nodelay', sockets, host='127.0.0.1', port=port,
+              tcp_nodelay=True)
+
+        path = os.path.join(directory, 'broker.sock')
+        bench('unix', [bind_unix_socket(path)], unix_socket=path)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,42 @@
 # -*- coding:utf-8 -*-
 
-from setuptools import find_packages, setup
+import platform
+
+from setuptools import Extension, find_packages, setup
+from setuptools.command.build_ext import build_ext
+from distutils.errors import (CCompilerError, DistutilsExecError,
+                              DistutilsPlatformError)
 
 version = '0.1.12'
 
+
+class optional_build_ext(build_ext):
+    # the C speedups are optional, torstomp falls back to pure Python
+
+    def run(self):
+        try:
+            build_ext.run(self)
+        except DistutilsPlatformError as error:
+            self._warn(error)
+
+    def build_extension(self, ext):
+        try:
+            build_ext.build_extension(self, ext)
+        except (CCompilerError, DistutilsExecError,
+                DistutilsPlatformError, ValueError) as error:
+            self._warn(error)
+
+    def _warn(self, error):
+        print('WARNING: torstomp C speedups could not be built (%s), '
+              'using the pure Python implementation' % error)
+
+
+ext_modules = []
+if platform.python_implementation() == 'CPython' and \
+        platform.python_version_tuple()[0] == '3':
+    ext_modules.append(
+        Extension('torstomp._speedups', ['torstomp/_speedups.c']))
+
 setup(
     name='torstomp',
     version=version,
@@ -18,11 +51,15 @@ setup(
     include_package_data=True,
     packages=find_packages(exclude=["tests", "tests.*"]),
     platforms=['any'],
+    ext_modules=ext_modules,
+    cmdclass={'build_ext': optional_build_ext},
     install_requires=[
         'six',
         'tornado',
     ],
     extras_require={
+        'msgpack': ['msgpack'],
+        'lz4': ['lz4'],
         'tests': [
             'mock',
             'nose',
@@ -0,0 +1,81 @@
+# -*- coding:utf-8 -*-
+from tornado import gen
+from tornado.iostream import StreamClosedError
+from tornado.netutil import bind_sockets, bind_unix_socket
+from tornado.tcpserver import TCPServer
+
+from torstomp.protocol import StompProtocol
+
+
+class FakeBroker(TCPServer):
+
+    CONNECTED = b'CONNECTED\nversion:1.1\n\n\x00'
+
+    def __init__(self, after_connect=b'', messages=0):
+        super(FakeBroker, self).__init__()
+        # raw bytes written right after CONNECTED
+        self.after_connect = after_connect
+        # MESSAGE frames sent for each SUBSCRIBE
+        self.messages = messages
+
+        self.received = b''
+        self.frames = []
+        self.streams = []
+
+    @property
+    def connections(self):
+        return len(self.streams)
+
+    def listen_tcp(self):
+        sockets = bind_sockets(0, '127.0.0.1')
+        self.add_sockets(sockets)
+
+        return sockets[0].getsockname()[1]
+
+    def listen_unix(self, path):
+        self.add_socket(bind_unix_socket(path))
+
+    @gen.coroutine
+    def handle_stream(self, stream, address):
+        protocol = StompProtocol()
+        self.streams.append(stream)
+
+        try:
+            while True:
+                data = yield stream.read_bytes(65536, partial=True)
+                self.received += data
+                protocol.add_data(data)
+
+                for frame in protocol.pop_frames():
+                    self.frames.append((frame.command, frame.headers))
+                    yield self.reply(stream, protocol, frame)
+        except StreamClosedError:
+            pass
+        finally:
+            self.streams.remove(stream)
+
+    def reply(self, stream, protocol, frame):
+        if frame.command == 'CONNECT':
+            return stream.write(self.CONNECTED + self.after_connect)
+
+        if frame.command == 'SUBSCRIBE' and self.messages:
+            return stream.write(b''.join(
+                protocol.build_frame('MESSAGE', {
+                    'subscription': frame.headers['id'],
+                    'destination': frame.headers['destination'],
+                    'message-id': '%s-%d' % (id(stream), index),
+                }, str(index))
+                for index in range(self.messages)))
+
+    def commands(self, command):
+        return [headers for name, headers in self.frames
+                if name == command]
+
+    def write(self, data):
+        return self.streams[-1].write(data)
+
+    def close(self):
+        self.stop()
+
+        for stream in list(self.streams):
+            stream.close()
@@ -0,0 +1,144 @@
+# -*- coding:utf-8 -*-
+import asyncio
+import os
+import shutil
+import socket
+import tempfile
+from datetime import timedelta
+from unittest import IsolatedAsyncioTestCase
+
+from mock import MagicMock
+
+from broker import FakeBroker
+from torstomp.aio import AioStomp
+
+
+class TestAioStomp(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.broker = FakeBroker()
+        port = self.broker.listen_tcp()
+        self.stomp = AioStomp('127.0.0.1', port, connect_headers={})
+
+    async def asyncTearDown(self):
+        if self.stomp._transport:
+            self.stomp._transport.close()
+        self.broker.close()
+
+    async def wait_for(self, condition):
+        for _ in range(100):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+
+        self.fail('condition not reached')
+
+    async def test_connect_and_subscribe(self):
+        on_connect = MagicMock()
+        self.stomp._on_connect = on_connect
+        self.stomp.subscribe('/topic/test', callback=MagicMock())
+
+        await self.stomp.connect()
+
+        self.assertTrue(self.stomp.connected)
+        self.assertEqual(on_connect.call_count, 1)
+
+        await self.wait_for(lambda: b'SUBSCRIBE' in self.broker.received)
+        self.assertEqual(
+            self.broker.received,
+            b'CONNECT\naccept-version:1.1\n\n\x00'
+            b'SUBSCRIBE\nack:auto\ndestination:/topic/test\nid:1\n\n\x00')
+
+    async def test_receive_message(self):
+        callback = MagicMock()
+        self.stomp.subscribe('/topic/test', callback=callback)
+
+        await self.stomp.connect()
+        await self.wait_for(lambda: self.broker.connections)
+        self.broker.write(
+            b'MESSAGE\nsubscription:1\nmessage-id:007\n\nblah\x00')
+
+        await self.wait_for(lambda: callback.called)
+        self.assertEqual(callback.call_args[0][1], 'blah')
+
+    async def test_send(self):
+        await self.stomp.connect()
+        self.stomp.send('/queue/test', body='hi')
+
+        await self.wait_for(lambda: b'SEND' in self.broker.received)
+        self.assertTrue(self.broker.received.endswith(
+            b'SEND\ncontent-length:2\ndestination:/queue/test\n\nhi\x00'))
+
+    async def test_request(self):
+        await self.stomp.connect()
+        future = self.stomp.request('/queue/rpc', body='ping')
+
+        correlation_id = '%s-1' % self.stomp._reply_prefix
+        await self.wait_for(lambda: b'SEND' in self.broker.received)
+        self.broker.write(
+            b'MESSAGE\nsubscription:1\nmessage-id:1\ncorrelation-id:' +
+            correlation_id.encode('ascii') + b'\n\npong\x00')
+
+        frame = await asyncio.wait_for(future, 1)
+        self.assertEqual(frame.body, 'pong')
+
+    async def test_disconnect_schedules_reconnect(self):
+        self.stomp._schedule_reconnect = MagicMock()
+        await self.stomp.connect()
+        await self.wait_for(lambda: self.broker.connections)
+
+        self.broker.close()
+
+        await self.wait_for(lambda: not self.stomp.connected)
+        self.assertEqual(self.stomp._schedule_reconnect.call_count, 1)
+
+    async def test_connect_error_schedules_reconnect(self):
+        self.broker.close()
+        self.stomp._reconnect_timeout = timedelta(milliseconds=10)
+        self.stomp._reconnect_max_attempts = 1
+        self.stomp.connect = MagicMock(wraps=self.stomp.connect)
+
+        await AioStomp.connect(self.stomp)
+
+        await self.wait_for(lambda: self.stomp.connect.call_count == 1)
+        self.assertFalse(self.stomp.connected)
+
+
+class TestAioStompTransport(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.broker = FakeBroker()
+        self.stomp = None
+
+    async def asyncTearDown(self):
+        if self.stomp is not None and self.stomp._transport:
+            self.stomp._transport.close()
+        self.broker.close()
+
+    async def test_connect_over_unix_socket(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'broker.sock')
+
+        self.broker.listen_unix(path)
+        self.stomp = AioStomp(unix_socket=path, connect_headers={})
+
+        await self.stomp.connect()
+
+        self.assertTrue(self.stomp.connected)
+        sock = self.stomp._transport.get_extra_info('socket')
+        self.assertEqual(sock.family, socket.AF_UNIX)
+
+    async def test_socket_options(self):
+        port = self.broker.listen_tcp()
+        self.stomp = AioStomp(
+            '127.0.0.1', port, connect_headers={}, tcp_nodelay=True,
+            socket_options=[(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)])
+
+        await self.stomp.connect()
+
+        sock = self.stomp._transport.get_extra_info('socket')
+        self.assertNotEqual(
+            sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY), 0)
+        self.assertNotEqual(
+            sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE), 0)
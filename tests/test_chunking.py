@@ -0,0 +1,123 @@
+# -*- coding:utf-8 -*-
+import io
+from unittest import TestCase
+
+from torstomp.chunking import ChunkAssembler, chunk_frames
+from torstomp.frame import Frame
+
+
+def build_frames(body, chunk_size, chunk_id='abc'):
+    frames = []
+
+    for index, (headers, chunk) in enumerate(
+            chunk_frames(body, {'destination': '/queue/a'}, chunk_size,
+                         chunk_id=chunk_id)):
+        headers = dict((key, str(value)) for key, value in headers.items())
+        headers['message-id'] = 'm%d' % index
+        headers['subscription'] = '1'
+        frames.append(Frame('MESSAGE', headers, raw_body=chunk))
+
+    return frames
+
+
+class TestChunkFrames(TestCase):
+
+    def test_split_body(self):
+        chunks = list(chunk_frames(b'abcdefg', {'x': '1'}, 3, chunk_id='id'))
+
+        self.assertEqual([chunk for _, chunk in chunks],
+                         [b'abc', b'def', b'g'])
+        self.assertEqual([h['torstomp-chunk-index'] for h, _ in chunks],
+                         [0, 1, 2])
+        self.assertEqual([h.get('torstomp-chunk-last') for h, _ in chunks],
+                         [None, None, 'true'])
+        self.assertTrue(all(h['torstomp-chunk-id'] == 'id'
+                            for h, _ in chunks))
+        self.assertEqual(chunks[2][0]['content-length'], 1)
+
+    def test_split_file_like(self):
+        chunks = list(chunk_frames(io.BytesIO(b'abcdef'), {}, 3))
+
+        self.assertEqual([chunk for _, chunk in chunks], [b'abc', b'def'])
+        self.assertEqual(chunks[1][0]['torstomp-chunk-last'], 'true')
+
+    def test_split_empty_body(self):
+        chunks = list(chunk_frames(b'', {}, 3))
+
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(chunks[0][1], b'')
+
+
+class TestChunkAssembler(TestCase):
+
+    def test_reassemble(self):
+        assembler = ChunkAssembler()
+        frames = build_frames(b'abcdefg', 3)
+
+        self.assertIsNone(assembler.add(frames[0]))
+        self.assertIsNone(assembler.add(frames[1]))
+
+        frame = assembler.add(frames[2])
+        self.assertEqual(frame.raw_body, b'abcdefg')
+        self.assertEqual(frame.body, u'abcdefg')
+        self.assertEqual(frame.message_ids, ['m0', 'm1', 'm2'])
+        self.assertNotIn('torstomp-chunk-id', frame.headers)
+        self.assertEqual(frame.headers['destination'], '/queue/a')
+
+    def test_reassemble_out_of_order(self):
+        assembler = ChunkAssembler()
+        frames = build_frames(b'abcdefg', 3)
+
+        self.assertIsNone(assembler.add(frames[2]))
+        self.assertIsNone(assembler.add(frames[0]))
+
+        frame = assembler.add(frames[1])
+        self.assertEqual(frame.raw_body, b'abcdefg')
+
+    def test_reassemble_into_sink(self):
+        sink = io.BytesIO()
+        factory_frames = []
+
+        def sink_factory(frame):
+            factory_frames.append(frame)
+            return sink
+
+        assembler = ChunkAssembler(sink_factory=sink_factory)
+
+        for frame in build_frames(b'abcdefg', 2):
+            result = assembler.add(frame)
+
+        self.assertIs(result.sink, sink)
+        self.assertIsNone(result.raw_body)
+        self.assertEqual(sink.read(), b'abcdefg')
+        self.assertEqual(len(factory_frames), 1)
+
+    def test_max_transfers(self):
+        assembler = ChunkAssembler(max_transfers=1)
+
+        assembler.add(build_frames(b'abcd', 2, chunk_id='first')[0])
+        assembler.add(build_frames(b'abcd', 2, chunk_id='second')[0])
+
+        self.assertEqual(list(assembler._transfers.keys()), ['second'])
+
+    def test_dropped_transfer_closes_sink(self):
+        sinks, dropped = [], []
+
+        def sink_factory(frame):
+            sinks.append(io.BytesIO())
+            return sinks[-1]
+
+        assembler = ChunkAssembler(sink_factory=sink_factory,
+                                   max_transfers=1, on_drop=dropped.append)
+
+        first = build_frames(b'abcdef', 2, chunk_id='first')
+        assembler.add(first[0])
+        assembler.add(first[1])
+        assembler.add(build_frames(b'abcd', 2, chunk_id='second')[0])
+
+        self.assertTrue(sinks[0].closed)
+        self.assertFalse(sinks[1].closed)
+
+        frame, = dropped
+        self.assertEqual(frame.message_ids, ['m0', 'm1'])
+        self.assertEqual(frame.headers['subscription'], '1')
@@ -0,0 +1,99 @@
+# -*- coding:utf-8 -*-
+import json
+import zlib
+from unittest import TestCase
+
+from torstomp.codec import CodecRegistry, JsonCodec
+
+
+class TestCodecRegistry(TestCase):
+
+    def setUp(self):
+        self.codecs = CodecRegistry(content_type='application/json',
+                                    content_encoding='deflate',
+                                    compress_threshold=64)
+
+    def test_encode_serializes_objects_with_default_content_type(self):
+        headers = {}
+        body = self.codecs.encode({'a': 1}, headers)
+
+        self.assertEqual(body, b'{"a":1}')
+        self.assertEqual(headers, {'content-type': 'application/json'})
+
+    def test_encode_keeps_text_body(self):
+        headers = {}
+        body = self.codecs.encode(u'Wilson Júnior', headers)
+
+        self.assertEqual(body, u'Wilson Júnior'.encode('utf-8'))
+        self.assertEqual(headers, {})
+
+    def test_encode_compress_above_threshold(self):
+        headers = {}
+        value = {'items': list(range(100))}
+        body = self.codecs.encode(value, headers)
+
+        self.assertEqual(headers['content-encoding'], 'deflate')
+        self.assertEqual(json.loads(zlib.decompress(body).decode('utf-8')),
+                         value)
+
+    def test_encode_unknown_content_type(self):
+        with self.assertRaises(ValueError):
+            self.codecs.encode({'a': 1}, {'content-type': 'text/x-unknown'})
+
+    def test_decode_roundtrip(self):
+        for encoding in ('deflate', 'gzip'):
+            headers = {'content-encoding': encoding}
+            value = {'items': list(range(100))}
+            body = self.codecs.encode(value, headers)
+
+            self.assertEqual(self.codecs.decode(body, headers), value)
+
+    def test_decode_without_headers_returns_text(self):
+        self.assertEqual(
+            self.codecs.decode(u'ç'.encode('utf-8'), {}), u'ç')
+
+    def test_decode_binary_content_type_returns_bytes(self):
+        self.assertEqual(
+            self.codecs.decode(
+                b'abc', {'content-type': 'application/octet-stream'}),
+            b'abc')
+
+    def test_bytes_roundtrip(self):
+        value = b'\xff\x00\xfe' * 50
+
+        for content_type in (None, 'application/octet-stream'):
+            headers = {}
+            if content_type:
+                headers['content-type'] = content_type
+
+            body = self.codecs.encode(value, headers)
+
+            self.assertEqual(headers['content-encoding'], 'deflate')
+            self.assertEqual(self.codecs.decode(body, headers), value)
+
+    def test_decode_content_type_with_parameters(self):
+        self.assertEqual(
+            self.codecs.decode(
+                b'[1]', {'content-type': 'application/json;charset=utf-8'}),
+            [1])
+
+    def test_register_custom_codec(self):
+        class UpperCodec(object):
+            content_type = 'text/x-upper'
+
+            def encode(self, value):
+                return value.upper().encode('utf-8')
+
+            def decode(self, data):
+                return data.decode('utf-8').lower()
+
+        codecs = CodecRegistry(defaults=False)
+        codecs.register(UpperCodec())
+
+        self.assertIsNone(codecs.serializer('application/json'))
+        self.assertEqual(
+            codecs.decode(b'ABC', {'content-type': 'text/x-upper'}), 'abc')
+
+    def test_json_codec(self):
+        codec = JsonCodec()
+        self.assertEqual(codec.decode(codec.encode([1, u'é'])), [1, u'é'])
@@ -0,0 +1,100 @@
+# -*- coding:utf-8 -*-
+from unittest import TestCase
+
+from mock import patch
+
+from torstomp.dedup import BloomDedup, LRUDedup, WindowDedup
+
+
+class TestLRUDedup(TestCase):
+
+    def test_add(self):
+        dedup = LRUDedup(max_size=2)
+
+        self.assertNotIn('a', dedup)
+        dedup.add('a')
+        self.assertIn('a', dedup)
+
+    def test_bounded(self):
+        dedup = LRUDedup(max_size=2)
+
+        for key in ('a', 'b', 'c'):
+            dedup.add(key)
+
+        self.assertNotIn('a', dedup)
+        self.assertIn('b', dedup)
+        self.assertIn('c', dedup)
+
+    def test_hit_refreshes_key(self):
+        dedup = LRUDedup(max_size=2)
+
+        dedup.add('a')
+        dedup.add('b')
+        self.assertIn('a', dedup)
+        dedup.add('c')
+
+        self.assertIn('a', dedup)
+        self.assertNotIn('b', dedup)
+
+    def test_add_refreshes_key(self):
+        dedup = LRUDedup(max_size=2)
+
+        for key in ('a', 'b', 'a', 'c'):
+            dedup.add(key)
+
+        self.assertIn('a', dedup)
+        self.assertNotIn('b', dedup)
+
+
+class TestWindowDedup(TestCase):
+
+    @patch('torstomp.dedup.time')
+    def test_expire(self, time_mock):
+        dedup = WindowDedup(window=1000)
+
+        time_mock.time.return_value = 10.0
+        dedup.add('a')
+        time_mock.time.return_value = 10.5
+        dedup.add('b')
+
+        self.assertIn('a', dedup)
+
+        time_mock.time.return_value = 11.2
+        self.assertNotIn('a', dedup)
+        self.assertIn('b', dedup)
+
+    def test_bounded(self):
+        dedup = WindowDedup(max_size=1)
+
+        dedup.add('a')
+        dedup.add('b')
+
+        self.assertNotIn('a', dedup)
+        self.assertIn('b', dedup)
+
+
+class TestBloomDedup(TestCase):
+
+    def test_add(self):
+        dedup = BloomDedup(capacity=1000, error_rate=0.001)
+
+        for index in range(1000):
+            dedup.add('message-%d' % index)
+
+        for index in range(1000):
+            self.assertIn('message-%d' % index, dedup)
+
+        false_positives = len([
+            index for index in range(1000, 11000)
+            if 'message-%d' % index in dedup])
+        self.assertLess(false_positives, 50)
+
+    def test_rotate_generations(self):
+        dedup = BloomDedup(capacity=10)
+
+        for index in range(30):
+            dedup.add('message-%d' % index)
+
+        self.assertIn('message-29', dedup)
+        self.assertIn('message-20', dedup)
+        self.assertNotIn('message-0', dedup)
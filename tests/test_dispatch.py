@@ -0,0 +1,252 @@
+# -*- coding:utf-8 -*-
+from unittest import TestCase
+
+from mock import MagicMock, patch
+
+from torstomp.dispatch import Dispatcher, FairDispatcher
+from torstomp.subscription import Subscription
+
+
+def build_subscription(id, priority=0, weight=1):
+    return Subscription('/queue/%d' % id, id, 'auto', {}, None,
+                        priority=priority, weight=weight)
+
+
+class TestDispatcher(TestCase):
+
+    def setUp(self):
+        self.dispatched = []
+        self.scheduled = []
+        self.flush = MagicMock()
+
+        self.dispatcher = Dispatcher(max_slice=2)
+        self.dispatcher.bind(self.dispatched.append, self.scheduled.append,
+                             self.flush)
+
+    def test_fifo_in_bounded_slices(self):
+        for index in range(3):
+            self.dispatcher.put(build_subscription(index), index)
+
+        self.assertEqual(len(self.scheduled), 1)
+        self.scheduled.pop(0)()
+
+        self.assertEqual(self.dispatched, [0, 1])
+        self.assertEqual(self.flush.call_count, 1)
+        self.assertEqual(len(self.dispatcher), 1)
+        self.assertEqual(len(self.scheduled), 1)
+
+        self.scheduled.pop(0)()
+        self.assertEqual(self.dispatched, [0, 1, 2])
+        self.assertEqual(self.flush.call_count, 2)
+        self.assertEqual(self.scheduled, [])
+
+    @patch('torstomp.dispatch.time')
+    def test_time_budget(self, time_mock):
+        time_mock.time.side_effect = [0.0, 0.001, 0.006, 0.007]
+        self.dispatcher.max_slice = None
+        self.dispatcher.time_budget = 5
+
+        for index in range(4):
+            self.dispatcher.put(None, index)
+
+        self.scheduled.pop(0)()
+
+        self.assertEqual(self.dispatched, [0, 1])
+        self.assertEqual(len(self.scheduled), 1)
+
+    def test_flush_error_does_not_stop_dispatch(self):
+        self.flush.side_effect = ValueError()
+
+        for index in range(3):
+            self.dispatcher.put(None, index)
+
+        self.scheduled.pop(0)()
+        self.assertEqual(len(self.scheduled), 1)
+
+    def test_clear(self):
+        self.dispatcher.put(None, 0)
+        self.dispatcher.clear()
+        self.scheduled.pop(0)()
+
+        self.assertEqual(self.dispatched, [])
+
+    def test_discard(self):
+        for index in range(4):
+            self.dispatcher.put(None, index)
+
+        self.dispatcher.discard(lambda frame: frame % 2)
+        self.scheduled.pop(0)()
+
+        self.assertEqual(self.dispatched, [0, 2])
+
+    def test_pause_while_full(self):
+        pause, resume = MagicMock(), MagicMock()
+        self.dispatcher.max_pending = 3
+        self.dispatcher.bind(self.dispatched.append, self.scheduled.append,
+                             pause=pause, resume=resume)
+
+        for index in range(4):
+            self.dispatcher.put(None, index)
+
+        self.assertEqual(pause.call_count, 1)
+        self.assertEqual(resume.call_count, 0)
+
+        self.scheduled.pop(0)()
+
+        self.assertEqual(self.dispatched, [0, 1])
+        self.assertEqual(resume.call_count, 1)
+
+    def test_discard_resumes(self):
+        pause, resume = MagicMock(), MagicMock()
+        self.dispatcher.max_pending = 2
+        self.dispatcher.bind(self.dispatched.append, self.scheduled.append,
+                             pause=pause, resume=resume)
+
+        self.dispatcher.put(None, 0)
+        self.dispatcher.put(None, 1)
+        self.dispatcher.discard(lambda frame: frame)
+
+        self.assertEqual(pause.call_count, 1)
+        self.assertEqual(resume.call_count, 1)
+
+
+class TestFairDispatcher(TestCase):
+
+    def setUp(self):
+        self.dispatched = []
+        self.scheduled = []
+
+        self.dispatcher = FairDispatcher(max_slice=100)
+        self.dispatcher.bind(self.dispatched.append, self.scheduled.append)
+
+    def run_scheduled(self):
+        while self.scheduled:
+            self.scheduled.pop(0)()
+
+    def test_fifo_inside_subscription(self):
+        subscription = build_subscription(1)
+
+        for index in range(3):
+            self.dispatcher.put(subscription, index)
+
+        self.assertEqual(len(self.scheduled), 1)
+        self.run_scheduled()
+
+        self.assertEqual(self.dispatched, [0, 1, 2])
+        self.assertEqual(len(self.dispatcher), 0)
+
+    def test_priority_first(self):
+        bulk = build_subscription(1)
+        control = build_subscription(2, priority=10)
+
+        for index in range(3):
+            self.dispatcher.put(bulk, 'bulk-%d' % index)
+
+        self.dispatcher.put(control, 'control')
+        self.run_scheduled()
+
+        self.assertEqual(self.dispatched[0], 'control')
+
+    def test_weighted_fair_queuing(self):
+        heavy = build_subscription(1, weight=3)
+        light = build_subscription(2, weight=1)
+
+        for index in range(8):
+            self.dispatcher.put(light, 'light')
+            self.dispatcher.put(heavy, 'heavy')
+
+        self.run_scheduled()
+
+        self.assertEqual(self.dispatched[:8].count('heavy'), 6)
+        self.assertEqual(self.dispatched[:8].count('light'), 2)
+
+    def test_new_subscription_does_not_get_backlog_credit(self):
+        first = build_subscription(1)
+        second = build_subscription(2)
+
+        for index in range(4):
+            self.dispatcher.put(first, 'first')
+
+        self.dispatcher.max_slice = 3
+        self.run_scheduled_once()
+        self.dispatcher.put(second, 'second')
+        self.dispatcher.put(second, 'second')
+        self.run_scheduled()
+
+        self.assertEqual(self.dispatched[3:],
+                         ['second', 'first', 'second'])
+
+    def run_scheduled_once(self):
+        self.scheduled.pop(0)()
+
+    def test_bounded_slices(self):
+        self.dispatcher.max_slice = 2
+        subscription = build_subscription(1)
+
+        for index in range(5):
+            self.dispatcher.put(subscription, index)
+
+        self.run_scheduled_once()
+        self.assertEqual(self.dispatched, [0, 1])
+        self.assertEqual(len(self.scheduled), 1)
+
+        self.run_scheduled()
+        self.assertEqual(self.dispatched, [0, 1, 2, 3, 4])
+
+    def test_handler_error_does_not_stop_slice(self):
+        def handler(frame):
+            if frame == 0:
+                raise ValueError()
+            self.dispatched.append(frame)
+
+        self.dispatcher.bind(handler, self.scheduled.append)
+        subscription = build_subscription(1)
+
+        for index in range(2):
+            self.dispatcher.put(subscription, index)
+
+        self.run_scheduled()
+        self.assertEqual(self.dispatched, [1])
+
+    def test_clear(self):
+        self.dispatcher.put(build_subscription(1), 0)
+        self.dispatcher.clear()
+        self.run_scheduled()
+
+        self.assertEqual(self.dispatched, [])
+
+    def test_discard(self):
+        first, second = build_subscription(1), build_subscription(2)
+
+        for index in range(3):
+            self.dispatcher.put(first, index)
+        self.dispatcher.put(second, 10)
+
+        self.dispatcher.discard(lambda frame: frame in (0, 10))
+        self.run_scheduled()
+
+        self.assertEqual(self.dispatched, [1, 2])
+        self.assertEqual(len(self.dispatcher), 0)
+
+    def test_pause_while_full(self):
+        pause, resume = MagicMock(), MagicMock()
+        self.dispatcher.max_pending = 2
+        self.dispatcher.bind(self.dispatched.append, self.scheduled.append,
+                             pause=pause, resume=resume)
+
+        self.dispatcher.put(build_subscription(1), 0)
+        self.dispatcher.put(build_subscription(2), 1)
+
+        self.assertEqual(len(self.dispatcher), 2)
+        self.assertEqual(pause.call_count, 1)
+
+        self.run_scheduled()
+
+        self.assertEqual(len(self.dispatcher), 0)
+        self.assertEqual(resume.call_count, 1)
+
+    def test_unknown_subscription(self):
+        self.dispatcher.put(None, 0)
+        self.run_scheduled()
+
+        self.assertEqual(self.dispatched, [0])
@@ -0,0 +1,86 @@
+# -*- coding:utf-8 -*-
+import logging
+import threading
+from unittest import TestCase
+
+from mock import MagicMock
+
+from torstomp.log import (SampledLog, start_background_logging,
+                          stop_background_logging)
+
+
+class TestSampledLog(TestCase):
+
+    def test_logs_first_and_every_nth_event(self):
+        logger = MagicMock()
+        logger.isEnabledFor.return_value = True
+        log = SampledLog(logger, 'beats: %d', every=3)
+
+        for _ in range(7):
+            log()
+
+        self.assertEqual(log.count, 7)
+        self.assertEqual(
+            [c[0] for c in logger.log.call_args_list], [
+                (logging.DEBUG, 'beats: %d', 1),
+                (logging.DEBUG, 'beats: %d', 4),
+                (logging.DEBUG, 'beats: %d', 7)])
+
+    def test_disabled_level_is_not_logged(self):
+        logger = MagicMock()
+        logger.isEnabledFor.return_value = False
+        log = SampledLog(logger, 'beats: %d', every=1)
+
+        log()
+        log()
+
+        self.assertEqual(log.count, 2)
+        self.assertEqual(logger.log.call_count, 0)
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        super(RecordingHandler, self).__init__()
+        self.records = []
+        self.threads = []
+
+    def emit(self, record):
+        self.records.append(record.getMessage())
+        self.threads.append(threading.current_thread())
+
+
+class TestBackgroundLogging(TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('TorStompTestLog')
+        self.logger.setLevel(logging.INFO)
+        self.handler = RecordingHandler()
+        self.logger.addHandler(self.handler)
+
+        self.addCleanup(self.logger.removeHandler, self.handler)
+        self.addCleanup(stop_background_logging, 'TorStompTestLog')
+
+    def test_records_are_handled_on_listener_thread(self):
+        listener = start_background_logging('TorStompTestLog')
+
+        self.assertIs(start_background_logging('TorStompTestLog'), listener)
+        self.assertFalse(self.logger.propagate)
+
+        self.logger.info('Flushed %d buffered messages', 3)
+        self.logger.debug('below the logger level')
+        stop_background_logging('TorStompTestLog')
+
+        self.assertEqual(self.handler.records, ['Flushed 3 buffered messages'])
+        self.assertIsNot(self.handler.threads[0], threading.current_thread())
+
+    def test_stop_restores_handlers(self):
+        start_background_logging('TorStompTestLog')
+        stop_background_logging('TorStompTestLog')
+        stop_background_logging('TorStompTestLog')
+
+        self.assertEqual(self.logger.handlers, [self.handler])
+        self.assertTrue(self.logger.propagate)
+
+        self.logger.info('direct')
+        self.assertEqual(self.handler.threads, [threading.current_thread()])
@@ -1,15 +1,30 @@
 # -*- coding: utf-8 -*-
 
+import datetime
+import json
+import os
+import shutil
+import socket
+import tempfile
+import zlib
+
 from torstomp import TorStomp
+from torstomp.codec import CodecRegistry
+from torstomp.dedup import LRUDedup
+from torstomp.dispatch import Dispatcher, FairDispatcher
+from torstomp.outbox import Outbox
+from torstomp.retry import RetryPolicy
 from torstomp.subscription import Subscription
 from torstomp.frame import Frame
 
 from tornado.testing import AsyncTestCase, gen_test
 from tornado import gen
-from tornado.iostream import StreamClosedError
+from tornado.iostream import SSLIOStream, StreamClosedError
 
 from mock import MagicMock
 
+from broker import FakeBroker
+
 
 class TestTorStomp(AsyncTestCase):
 
@@ -37,6 +52,7 @@ class TestTorStomp(AsyncTestCase):
         connect_future = gen.Future()
         connect_future.set_result(None)
         io_stream.connect.return_value = connect_future
+        io_stream.read_bytes.return_value = gen.Future()
 
         self.stomp._build_io_stream.return_value = io_stream
 
@@ -177,6 +193,833 @@ class TestTorStomp(AsyncTestCase):
             b'my-header:my-value\n\n'
             b'{}\x00')
 
+    def test_send_does_not_change_headers(self):
+        self.stomp.stream = MagicMock()
+        headers = {'my-header': 'my-value'}
+        self.stomp.send('/topic/test', headers=headers, body='{}')
+
+        self.assertEqual(headers, {'my-header': 'my-value'})
+
+    def test_send_with_codecs(self):
+        self.stomp._codecs = CodecRegistry(
+            content_type='application/json', content_encoding='deflate',
+            compress_threshold=10)
+        self.stomp.stream = MagicMock()
+        self.stomp.send('/topic/test', body={'a': 'b' * 20},
+                        send_content_length=False)
+
+        buf = self.stomp.stream.write.call_args[0][0]
+        raw_headers, body = buf.split(b'\n\n', 1)
+        headers = dict(line.split(b":", 1) for line in raw_headers.split(b'\n')[1:])
+
+        self.assertEqual(headers[b'content-type'], b'application/json')
+        self.assertEqual(headers[b'content-encoding'], b'deflate')
+        self.assertEqual(int(headers[b'content-length']), len(body) - 1)
+        self.assertEqual(
+            json.loads(zlib.decompress(body[:-1]).decode('utf-8')),
+            {'a': 'b' * 20})
+
+    def test_send_with_codecs_below_threshold(self):
+        self.stomp._codecs = CodecRegistry(
+            content_type='application/json', content_encoding='deflate')
+        self.stomp.stream = MagicMock()
+        self.stomp.send('/topic/test', body={'a': 1})
+
+        self.assertEqual(
+            self.stomp.stream.write.call_args[0][0],
+            b'SEND\n'
+            b'content-length:7\n'
+            b'content-type:application/json\n'
+            b'destination:/topic/test\n\n'
+            b'{"a":1}\x00')
+
+    def test_subscription_with_codecs_receives_decoded_payload(self):
+        callback = MagicMock()
+
+        self.stomp.stream = MagicMock()
+        self.stomp.subscribe('/topic/test', callback=callback,
+                             codecs=CodecRegistry())
+
+        body = zlib.compress(b'{"a":1}')
+        self.stomp._on_data(
+            b'MESSAGE\n'
+            b'subscription:1\n'
+            b'message-id:007\n'
+            b'content-type:application/json\n'
+            b'content-encoding:deflate\n'
+            b'content-length:' + str(len(body)).encode('ascii') + b'\n'
+            b'\n' + body + b'\x00')
+
+        self.assertEqual(callback.call_count, 1)
+        self.assertEqual(callback.call_args[0][1], {'a': 1})
+        self.assertEqual(callback.call_args[0][0].raw_body, body)
+
+    @gen_test
+    def test_send_chunked(self):
+        self.stomp.stream = MagicMock()
+
+        write_future = gen.Future()
+        write_future.set_result(None)
+        self.stomp.stream.write.return_value = write_future
+
+        self.stomp._chunk_size = 4
+        yield self.stomp.send('/topic/test', body='abcdefghij')
+
+        write_calls = self.stomp.stream.write.call_args_list
+        self.assertEqual(len(write_calls), 3)
+
+        bodies = [call[0][0].split(b'\n\n', 1)[1] for call in write_calls]
+        self.assertEqual(bodies, [b'abcd\x00', b'efgh\x00', b'ij\x00'])
+        self.assertIn(b'torstomp-chunk-index:1\n', write_calls[1][0][0])
+        self.assertIn(b'torstomp-chunk-last:true\n', write_calls[2][0][0])
+
+    def test_send_below_chunk_size(self):
+        self.stomp.stream = MagicMock()
+        self.stomp._chunk_size = 4
+        self.stomp.send('/topic/test', body='abc')
+
+        self.assertEqual(self.stomp.stream.write.call_count, 1)
+        self.assertNotIn(b'torstomp-chunk-id',
+                         self.stomp.stream.write.call_args[0][0])
+
+    def test_chunked_subscription_called_once(self):
+        callback = MagicMock()
+
+        self.stomp.stream = MagicMock()
+        self.stomp.subscribe('/topic/test', ack='client-individual',
+                             callback=callback, chunked=True)
+
+        for index, chunk in enumerate((b'abc', b'd\x00f')):
+            last = b'torstomp-chunk-last:true\n' if index else b''
+            self.stomp._on_data(
+                b'MESSAGE\n'
+                b'subscription:1\n'
+                b'message-id:00' + str(index).encode('ascii') + b'\n'
+                b'content-length:3\n'
+                b'torstomp-chunk-id:xyz\n'
+                b'torstomp-chunk-index:' + str(index).encode('ascii') + b'\n' +
+                last + b'\n' + chunk + b'\x00')
+
+        self.assertEqual(callback.call_count, 1)
+
+        frame = callback.call_args[0][0]
+        self.assertEqual(frame.raw_body, b'abcd\x00f')
+
+        self.stomp.ack(frame)
+        write_calls = self.stomp.stream.write.call_args_list
+        self.assertEqual(len(write_calls), 2)
+        self.assertEqual(
+            write_calls[0][0][0],
+            b'ACK\nmessage-id:000\nsubscription:1\n\n\x00')
+        self.assertEqual(
+            write_calls[1][0][0],
+            b'ACK\nmessage-id:001\nsubscription:1\n\n\x00')
+
+    def test_dropped_chunked_message_is_nacked(self):
+        self.stomp.stream = MagicMock()
+        subscription = self.stomp.subscribe(
+            '/topic/test', ack='client', callback=MagicMock(), chunked=True)
+        subscription.assembler._max_transfers = 1
+
+        self.stomp._on_data(
+            b'MESSAGE\nsubscription:1\nmessage-id:1\n'
+            b'torstomp-chunk-id:x\ntorstomp-chunk-index:0\n\nab\x00'
+            b'MESSAGE\nsubscription:1\nmessage-id:2\n'
+            b'torstomp-chunk-id:y\ntorstomp-chunk-index:0\n\ncd\x00')
+
+        self.assertEqual(
+            [c[0][0] for c in self.stomp.stream.write.call_args_list], [
+                b'NACK\nmessage-id:1\nsubscription:1\n\n\x00'])
+
+    @gen_test
+    def test_request_resolved_by_reply(self):
+        self.stomp.stream = MagicMock()
+        self.stomp.connected = True
+        self.stomp._reply_destination = '/temp-queue/replies'
+
+        future = self.stomp.request('/queue/rpc', body='ping', timeout=1000)
+
+        write_calls = self.stomp.stream.write.call_args_list
+        self.assertEqual(
+            write_calls[0][0][0],
+            b'SUBSCRIBE\n'
+            b'ack:auto\n'
+            b'destination:/temp-queue/replies\n'
+            b'id:1\n\n\x00')
+
+        correlation_id = '%s-1' % self.stomp._reply_prefix
+        self.assertEqual(
+            write_calls[1][0][0],
+            b'SEND\n'
+            b'content-length:4\n'
+            b'correlation-id:' + correlation_id.encode('ascii') + b'\n'
+            b'destination:/queue/rpc\n'
+            b'reply-to:/temp-queue/replies\n\n'
+            b'ping\x00')
+
+        self.stomp._on_data(
+            b'MESSAGE\n'
+            b'subscription:1\n'
+            b'message-id:007\n'
+            b'correlation-id:' + correlation_id.encode('ascii') + b'\n'
+            b'\n'
+            b'pong\x00')
+
+        frame = yield future
+        self.assertEqual(frame.body, 'pong')
+        self.assertEqual(self.stomp._pending_requests, {})
+
+    def test_requests_share_reply_subscription(self):
+        self.stomp.stream = MagicMock()
+
+        self.stomp.request('/queue/rpc', body='1')
+        self.stomp.request('/queue/rpc', body='2')
+
+        self.assertEqual(len(self.stomp._subscriptions), 1)
+        self.assertEqual(len(self.stomp._pending_requests), 2)
+
+    @gen_test
+    def test_request_timeout(self):
+        self.stomp.stream = MagicMock()
+
+        with self.assertRaises(gen.TimeoutError):
+            yield self.stomp.request('/queue/rpc', body='ping', timeout=10)
+
+        self.assertEqual(self.stomp._pending_requests, {})
+
+    def test_reply(self):
+        self.stomp.stream = MagicMock()
+
+        frame = Frame('MESSAGE', {
+            'reply-to': '/temp-queue/replies',
+            'correlation-id': 'abc-1'
+        }, 'ping')
+
+        self.stomp.reply(frame, body='pong')
+        self.assertEqual(
+            self.stomp.stream.write.call_args[0][0],
+            b'SEND\n'
+            b'content-length:4\n'
+            b'correlation-id:abc-1\n'
+            b'destination:/temp-queue/replies\n\n'
+            b'pong\x00')
+
+    def test_send_while_disconnected_goes_to_outbox(self):
+        self.stomp._outbox = Outbox()
+        self.stomp.stream = MagicMock()
+
+        self.stomp.send('/topic/test', body='a')
+
+        self.assertEqual(self.stomp.stream.write.call_count, 0)
+        self.assertEqual(len(self.stomp._outbox), 1)
+
+    def test_send_on_closed_stream_goes_to_outbox(self):
+        self.stomp._outbox = Outbox()
+        self.stomp.stream = MagicMock()
+        self.stomp.stream.write.side_effect = StreamClosedError()
+        self.stomp.connected = True
+
+        self.stomp.send('/topic/test', body='a')
+
+        self.assertEqual(len(self.stomp._outbox), 1)
+
+    @gen_test
+    def test_connect_flushes_outbox(self):
+        self.stomp._outbox = Outbox()
+        self.stomp.send('/topic/test', body='a')
+        self.stomp.send('/topic/test', body='b')
+
+        io_stream = MagicMock()
+
+        write_future = gen.Future()
+        write_future.set_result(None)
+        io_stream.write.return_value = write_future
+
+        connect_future = gen.Future()
+        connect_future.set_result(None)
+        io_stream.connect.return_value = connect_future
+
+        self.stomp._build_io_stream = MagicMock(return_value=io_stream)
+
+        yield self.stomp.connect()
+
+        write_calls = io_stream.write.call_args_list
+        self.assertEqual(len(write_calls), 2)
+        self.assertEqual(
+            write_calls[1][0][0],
+            b'SEND\ncontent-length:1\ndestination:/topic/test\n\na\x00'
+            b'SEND\ncontent-length:1\ndestination:/topic/test\n\nb\x00')
+        self.assertEqual(len(self.stomp._outbox), 0)
+
+    @gen_test
+    def test_send_during_outbox_flush_keeps_order(self):
+        self.stomp._outbox = Outbox()
+        self.stomp.send('/topic/test', body='a')
+
+        io_stream = MagicMock()
+        done = gen.Future()
+        done.set_result(None)
+        flushed = gen.Future()
+        io_stream.write.side_effect = [done, flushed, done, done]
+
+        connect_future = gen.Future()
+        connect_future.set_result(None)
+        io_stream.connect.return_value = connect_future
+        io_stream.read_bytes.return_value = gen.Future()
+
+        self.stomp._build_io_stream = MagicMock(return_value=io_stream)
+
+        connecting = self.stomp.connect()
+
+        for _ in range(10):
+            if io_stream.write.call_count == 2:
+                break
+            yield gen.moment
+
+        self.stomp.send('/topic/test', body='b')
+        self.assertEqual(io_stream.write.call_count, 2)
+
+        flushed.set_result(None)
+        yield connecting
+
+        write_calls = io_stream.write.call_args_list
+        self.assertEqual(
+            [c[0][0] for c in write_calls[1:]], [
+                b'SEND\ncontent-length:1\ndestination:/topic/test\n\na\x00',
+                b'SEND\ncontent-length:1\ndestination:/topic/test\n\nb\x00'])
+        self.assertEqual(len(self.stomp._outbox), 0)
+
+        self.stomp.send('/topic/test', body='c')
+        self.assertEqual(io_stream.write.call_count, 4)
+
+    def test_dedup_skips_and_acks_duplicates(self):
+        callback = MagicMock()
+
+        self.stomp.stream = MagicMock()
+        self.stomp.subscribe('/topic/test', ack='client', callback=callback,
+                             dedup=LRUDedup())
+
+        message = (
+            b'MESSAGE\n'
+            b'subscription:1\n'
+            b'message-id:007\n'
+            b'\n'
+            b'blah\x00')
+
+        self.stomp._on_data(message)
+        self.stomp._on_data(message)
+
+        self.assertEqual(callback.call_count, 1)
+        self.assertEqual(self.stomp.stream.write.call_count, 1)
+        self.assertEqual(
+            self.stomp.stream.write.call_args[0][0],
+            b'ACK\nmessage-id:007\nsubscription:1\n\n\x00')
+
+    def test_dedup_custom_header(self):
+        callback = MagicMock()
+
+        self.stomp.stream = MagicMock()
+        self.stomp.subscribe('/topic/test', callback=callback,
+                             dedup=LRUDedup(), dedup_header='event-id')
+
+        for message_id in (b'1', b'2'):
+            self.stomp._on_data(
+                b'MESSAGE\n'
+                b'subscription:1\n'
+                b'message-id:' + message_id + b'\n'
+                b'event-id:abc\n'
+                b'\n'
+                b'blah\x00')
+
+        self.assertEqual(callback.call_count, 1)
+        self.assertEqual(self.stomp.stream.write.call_count, 0)
+
+    def test_dedup_does_not_record_nacked_messages(self):
+        self.stomp.stream = MagicMock()
+        callback = MagicMock(side_effect=lambda frame, message:
+                             self.stomp.nack(frame))
+        self.stomp.subscribe('/topic/test', ack='client', callback=callback,
+                             dedup=LRUDedup())
+
+        message = (
+            b'MESSAGE\n'
+            b'subscription:1\n'
+            b'message-id:007\n'
+            b'\n'
+            b'blah\x00')
+
+        self.stomp._on_data(message)
+        self.stomp._on_data(message)
+
+        self.assertEqual(callback.call_count, 2)
+
+    def test_dedup_chunks_are_redelivered_after_nack(self):
+        self.stomp.stream = MagicMock()
+        bodies = []
+
+        def callback(frame, message):
+            bodies.append(message)
+
+            if len(bodies) == 1:
+                self.stomp.nack(frame)
+
+        self.stomp.subscribe('/topic/test', ack='client', callback=callback,
+                             chunked=True, dedup=LRUDedup())
+
+        chunks = (
+            b'MESSAGE\nsubscription:1\nmessage-id:1\n'
+            b'torstomp-chunk-id:x\ntorstomp-chunk-index:0\n\nab\x00'
+            b'MESSAGE\nsubscription:1\nmessage-id:2\n'
+            b'torstomp-chunk-id:x\ntorstomp-chunk-index:1\n'
+            b'torstomp-chunk-last:true\n\ncd\x00')
+
+        self.stomp._on_data(chunks)
+        self.stomp._on_data(chunks)
+        self.assertEqual(bodies, ['abcd', 'abcd'])
+
+        self.stomp.stream.write.reset_mock()
+        self.stomp._on_data(chunks)
+
+        self.assertEqual(len(bodies), 2)
+        self.assertEqual(
+            [c[0][0] for c in self.stomp.stream.write.call_args_list], [
+                b'ACK\nmessage-id:1\nsubscription:1\n\n\x00',
+                b'ACK\nmessage-id:2\nsubscription:1\n\n\x00'])
+
+    def test_dedup_does_not_record_failed_messages(self):
+        callback = MagicMock(side_effect=[ValueError(), None])
+
+        self.stomp.stream = MagicMock()
+        self.stomp.subscribe('/topic/test', callback=callback,
+                             dedup=LRUDedup())
+
+        message = (
+            b'MESSAGE\n'
+            b'subscription:1\n'
+            b'message-id:007\n'
+            b'\n'
+            b'blah\x00')
+
+        with self.assertRaises(ValueError):
+            self.stomp._on_data(message)
+
+        self.stomp._on_data(message)
+        self.assertEqual(callback.call_count, 2)
+
+    @gen_test
+    def test_dispatcher_runs_on_next_iteration(self):
+        self.stomp = TorStomp(dispatcher=FairDispatcher())
+        self.stomp.stream = MagicMock()
+
+        bulk = MagicMock()
+        control = MagicMock()
+        calls = []
+        bulk.side_effect = lambda frame, message: calls.append(message)
+        control.side_effect = lambda frame, message: calls.append(message)
+
+        self.stomp.subscribe('/queue/bulk', callback=bulk)
+        self.stomp.subscribe('/queue/control', callback=control, priority=1)
+
+        self.stomp._on_data(
+            b'MESSAGE\nsubscription:1\nmessage-id:1\n\nbulk\x00'
+            b'MESSAGE\nsubscription:2\nmessage-id:2\n\ncontrol\x00')
+
+        self.assertEqual(calls, [])
+
+        yield gen.moment
+        self.assertEqual(calls, ['control', 'bulk'])
+
+    def test_batch_callback_receives_frames_of_data_chunk(self):
+        batch_callback = MagicMock()
+
+        self.stomp.stream = MagicMock()
+        self.stomp.subscribe('/queue/a', batch_callback=batch_callback)
+
+        self.stomp._on_data(
+            b'MESSAGE\nsubscription:1\nmessage-id:1\n\none\x00'
+            b'MESSAGE\nsubscription:1\nmessage-id:2\n\ntwo\x00')
+
+        self.assertEqual(batch_callback.call_count, 1)
+        frames = batch_callback.call_args[0][0]
+        self.assertEqual([frame.body for frame in frames], ['one', 'two'])
+
+    def test_batch_size(self):
+        batch_callback = MagicMock()
+
+        self.stomp.stream = MagicMock()
+        self.stomp.subscribe('/queue/a', batch_callback=batch_callback,
+                             batch_size=2)
+
+        self.stomp._on_data(b''.join(
+            b'MESSAGE\nsubscription:1\nmessage-id:%d\n\nmsg\x00' % index
+            for index in range(5)))
+
+        self.assertEqual(
+            [len(call[0][0]) for call in batch_callback.call_args_list],
+            [2, 2, 1])
+
+    def test_batch_callback_records_dedup(self):
+        batch_callback = MagicMock()
+
+        self.stomp.stream = MagicMock()
+        self.stomp.subscribe('/queue/a', batch_callback=batch_callback,
+                             dedup=LRUDedup())
+
+        message = b'MESSAGE\nsubscription:1\nmessage-id:1\n\none\x00'
+        self.stomp._on_data(message)
+        self.stomp._on_data(message)
+
+        self.assertEqual(batch_callback.call_count, 1)
+
+    @gen_test
+    def test_batch_callback_with_dispatcher(self):
+        self.stomp = TorStomp(dispatcher=Dispatcher(max_slice=2))
+        self.stomp.stream = MagicMock()
+
+        batch_callback = MagicMock()
+        self.stomp.subscribe('/queue/a', batch_callback=batch_callback)
+
+        self.stomp._on_data(b''.join(
+            b'MESSAGE\nsubscription:1\nmessage-id:%d\n\nmsg\x00' % index
+            for index in range(3)))
+
+        self.assertEqual(batch_callback.call_count, 0)
+
+        yield gen.moment
+        self.assertEqual(batch_callback.call_count, 1)
+        self.assertEqual(len(batch_callback.call_args[0][0]), 2)
+
+        yield gen.moment
+        self.assertEqual(batch_callback.call_count, 2)
+        self.assertEqual(len(batch_callback.call_args[0][0]), 1)
+
+    def test_disconnect_flushes_auto_ack_batches(self):
+        self.stomp = TorStomp(dispatcher=Dispatcher(max_slice=1))
+        self.stomp.stream = MagicMock()
+        self.stomp._schedule_reconnect = MagicMock()
+
+        auto_callback = MagicMock(side_effect=ValueError('boom'))
+        client_callback = MagicMock()
+        self.stomp.subscribe('/queue/auto', batch_callback=auto_callback)
+        self.stomp.subscribe('/queue/client', ack='client',
+                             batch_callback=client_callback)
+
+        self.stomp._on_data(
+            b'MESSAGE\nsubscription:1\nmessage-id:1\n\na\x00'
+            b'MESSAGE\nsubscription:2\nmessage-id:2\n\nb\x00')
+
+        # pending batches, as between two dispatch slices
+        dispatcher = self.stomp._dispatcher
+        self.stomp._add_to_batch(
+            self.stomp._subscriptions['1'], dispatcher._next_frame())
+        self.stomp._add_to_batch(
+            self.stomp._subscriptions['2'], dispatcher._next_frame())
+
+        self.stomp._on_disconnect_socket()
+
+        self.assertEqual(
+            [frame.body for frame in auto_callback.call_args[0][0]], ['a'])
+        self.assertEqual(client_callback.call_count, 0)
+        self.assertEqual(len(self.stomp._batches), 0)
+
+    def test_disconnect_keeps_auto_ack_frames_in_dispatcher(self):
+        dispatcher = Dispatcher()
+        self.stomp = TorStomp(dispatcher=dispatcher)
+        self.stomp.stream = MagicMock()
+        self.stomp._schedule_reconnect = MagicMock()
+
+        auto_callback, client_callback = MagicMock(), MagicMock()
+        self.stomp.subscribe('/queue/auto', callback=auto_callback)
+        self.stomp.subscribe('/queue/client', ack='client',
+                             callback=client_callback)
+        self.stomp.stream.write.reset_mock()
+
+        self.stomp._on_data(
+            b'MESSAGE\nsubscription:1\nmessage-id:1\n\na\x00'
+            b'MESSAGE\nsubscription:2\nmessage-id:2\n\nb\x00'
+            b'MESSAGE\nsubscription:1\nmessage-id:3\n\nc\x00')
+        self.stomp._on_disconnect_socket()
+        dispatcher.run_slice()
+
+        self.assertEqual(
+            [c[0][1] for c in auto_callback.call_args_list], ['a', 'c'])
+        self.assertEqual(client_callback.call_count, 0)
+        self.assertEqual(len(dispatcher), 0)
+
+    def test_dispatcher_closes_stream_on_callback_error(self):
+        dispatcher = Dispatcher()
+        self.stomp = TorStomp(dispatcher=dispatcher)
+        self.stomp.stream = MagicMock()
+
+        client_callback = MagicMock(side_effect=ValueError('boom'))
+        auto_callback = MagicMock()
+        self.stomp.subscribe('/queue/client', ack='client',
+                             callback=client_callback)
+        self.stomp.subscribe('/queue/auto', callback=auto_callback)
+
+        self.stomp._on_data(
+            b'MESSAGE\nsubscription:1\nmessage-id:1\n\na\x00'
+            b'MESSAGE\nsubscription:1\nmessage-id:2\n\nb\x00'
+            b'MESSAGE\nsubscription:2\nmessage-id:3\n\nc\x00')
+        dispatcher.run_slice()
+
+        self.assertEqual(client_callback.call_count, 1)
+        self.assertEqual(auto_callback.call_count, 1)
+        self.stomp.stream.close.assert_called_once_with()
+
+    def test_dispatcher_closes_stream_on_batch_callback_error(self):
+        dispatcher = Dispatcher()
+        self.stomp = TorStomp(dispatcher=dispatcher)
+        self.stomp.stream = MagicMock()
+
+        self.stomp.subscribe('/queue/client', ack='client',
+                             batch_callback=MagicMock(side_effect=ValueError))
+
+        self.stomp._on_data(
+            b'MESSAGE\nsubscription:1\nmessage-id:1\n\na\x00')
+        dispatcher.run_slice()
+
+        self.stomp.stream.close.assert_called_once_with()
+
+    @gen_test
+    def test_send_with_delay(self):
+        self.stomp.stream = MagicMock()
+
+        self.stomp.send('/topic/test', body='a', delay=10)
+        self.assertEqual(self.stomp.stream.write.call_count, 0)
+
+        yield gen.sleep(0.05)
+        self.assertEqual(self.stomp.stream.write.call_count, 1)
+        self.assertEqual(
+            self.stomp.stream.write.call_args[0][0],
+            b'SEND\ncontent-length:1\ndestination:/topic/test\n\na\x00')
+
+    @gen_test
+    def test_cancel_delayed_send(self):
+        self.stomp.stream = MagicMock()
+
+        handle = self.stomp.send('/topic/test', body='a', delay=10)
+        handle.cancel()
+
+        yield gen.sleep(0.05)
+        self.assertEqual(self.stomp.stream.write.call_count, 0)
+
+    @gen_test
+    def test_send_at(self):
+        self.stomp.stream = MagicMock()
+
+        self.stomp.send_at(
+            datetime.datetime.now() + datetime.timedelta(milliseconds=10),
+            '/topic/test', body='a')
+        self.assertEqual(self.stomp.stream.write.call_count, 0)
+
+        yield gen.sleep(0.05)
+        self.assertEqual(self.stomp.stream.write.call_count, 1)
+
+    def test_send_with_broker_delay_header(self):
+        self.stomp._delay_header = 'AMQ_SCHEDULED_DELAY'
+        self.stomp.stream = MagicMock()
+
+        self.stomp.send('/topic/test', body='a', delay=1500)
+
+        self.assertEqual(
+            self.stomp.stream.write.call_args[0][0],
+            b'SEND\nAMQ_SCHEDULED_DELAY:1500\ncontent-length:1\n'
+            b'destination:/topic/test\n\na\x00')
+
+    @gen_test
+    def test_failed_message_nacked_after_backoff(self):
+        self.stomp.stream = MagicMock()
+        self.stomp.subscribe(
+            '/queue/a', ack='client-individual',
+            callback=MagicMock(side_effect=ValueError('boom')),
+            retry_policy=RetryPolicy(backoff=10))
+
+        self.stomp._on_data(
+            b'MESSAGE\nsubscription:1\nmessage-id:1\n'
+            b'destination:/queue/a\n\nbody\x00')
+
+        self.assertEqual(self.stomp.stream.write.call_count, 0)
+
+        yield gen.sleep(0.05)
+        self.assertEqual(
+            self.stomp.stream.write.call_args[0][0],
+            b'NACK\nmessage-id:1\nsubscription:1\n\n\x00')
+
+    def test_exhausted_message_goes_to_dead_letter(self):
+        self.stomp.stream = MagicMock()
+        self.stomp.subscribe(
+            '/queue/a', ack='client-individual',
+            callback=MagicMock(side_effect=ValueError('boom')),
+            retry_policy=RetryPolicy(
+                max_attempts=2, dead_letter='/queue/a.dlq',
+                count_header='x-delivery-count'))
+
+        self.stomp._on_data(
+            b'MESSAGE\nsubscription:1\nmessage-id:1\n'
+            b'destination:/queue/a\nx-delivery-count:1\n'
+            b'content-length:4\n\nbody\x00')
+
+        write_calls = self.stomp.stream.write.call_args_list
+        self.assertEqual(len(write_calls), 2)
+        self.assertEqual(
+            write_calls[0][0][0],
+            b'SEND\n'
+            b'content-length:4\n'
+            b'destination:/queue/a.dlq\n'
+            b'failure-attempts:2\n'
+            b'failure-reason:boom\n'
+            b'original-destination:/queue/a\n'
+            b'x-delivery-count:1\n\n'
+            b'body\x00')
+        self.assertEqual(
+            write_calls[1][0][0],
+            b'ACK\nmessage-id:1\nsubscription:1\n\n\x00')
+
+    @gen_test
+    def test_republish_with_backoff(self):
+        self.stomp.stream = MagicMock()
+        self.stomp.subscribe(
+            '/queue/a',
+            callback=MagicMock(side_effect=ValueError('boom')),
+            retry_policy=RetryPolicy(backoff=10, republish=True))
+
+        self.stomp._on_data(
+            b'MESSAGE\nsubscription:1\nmessage-id:1\n'
+            b'destination:/queue/a\n\nbody\x00')
+
+        self.assertEqual(self.stomp.stream.write.call_count, 0)
+
+        yield gen.sleep(0.05)
+        self.assertEqual(
+            self.stomp.stream.write.call_args[0][0],
+            b'SEND\n'
+            b'content-length:4\n'
+            b'destination:/queue/a\n'
+            b'torstomp-retry-count:1\n\n'
+            b'body\x00')
+
+    @gen_test
+    def test_auto_ack_republished_message_goes_to_dead_letter(self):
+        self.stomp.stream = MagicMock()
+        self.stomp.subscribe(
+            '/queue/a',
+            callback=MagicMock(side_effect=ValueError('boom')),
+            retry_policy=RetryPolicy(
+                max_attempts=2, backoff=10, dead_letter='/queue/a.dlq'))
+
+        self.stomp._on_data(
+            b'MESSAGE\nsubscription:1\nmessage-id:1\n'
+            b'destination:/queue/a\n\nbody\x00')
+
+        yield gen.sleep(0.05)
+        self.assertEqual(
+            self.stomp.stream.write.call_args[0][0],
+            b'SEND\n'
+            b'content-length:4\n'
+            b'destination:/queue/a\n'
+            b'torstomp-retry-count:1\n\n'
+            b'body\x00')
+
+        # the broker redelivers the copy with a new message-id
+        self.stomp._on_data(
+            b'MESSAGE\nsubscription:1\nmessage-id:2\n'
+            b'destination:/queue/a\ntorstomp-retry-count:1\n\nbody\x00')
+
+        self.assertEqual(self.stomp.stream.write.call_count, 2)
+        self.assertEqual(
+            self.stomp.stream.write.call_args[0][0],
+            b'SEND\n'
+            b'content-length:4\n'
+            b'destination:/queue/a.dlq\n'
+            b'failure-attempts:2\n'
+            b'failure-reason:boom\n'
+            b'original-destination:/queue/a\n'
+            b'torstomp-retry-count:1\n\n'
+            b'body\x00')
+
+    def test_exhausted_sink_message_is_nacked(self):
+        self.stomp.stream = MagicMock()
+        self.stomp.subscribe(
+            '/queue/a', ack='client-individual',
+            callback=MagicMock(side_effect=ValueError('boom')),
+            sink_factory=lambda frame: tempfile.TemporaryFile(),
+            retry_policy=RetryPolicy(max_attempts=1, dead_letter='/dlq'))
+
+        self.stomp._on_data(
+            b'MESSAGE\nsubscription:1\nmessage-id:1\ndestination:/queue/a\n'
+            b'torstomp-chunk-id:x\ntorstomp-chunk-index:0\n\nab\x00'
+            b'MESSAGE\nsubscription:1\nmessage-id:2\ndestination:/queue/a\n'
+            b'torstomp-chunk-id:x\ntorstomp-chunk-index:1\n'
+            b'torstomp-chunk-last:true\n\ncd\x00')
+
+        self.assertEqual(
+            [c[0][0] for c in self.stomp.stream.write.call_args_list], [
+                b'NACK\nmessage-id:1\nsubscription:1\n\n\x00',
+                b'NACK\nmessage-id:2\nsubscription:1\n\n\x00'])
+
+    def test_chunked_message_goes_to_dead_letter_in_chunks(self):
+        self.stomp.stream = MagicMock()
+
+        write_future = gen.Future()
+        write_future.set_result(None)
+        self.stomp.stream.write.return_value = write_future
+
+        self.stomp.subscribe(
+            '/queue/a', ack='client-individual', chunked=True,
+            callback=MagicMock(side_effect=ValueError('boom')),
+            retry_policy=RetryPolicy(max_attempts=1, dead_letter='/dlq'))
+
+        self.stomp._on_data(
+            b'MESSAGE\nsubscription:1\nmessage-id:1\ndestination:/queue/a\n'
+            b'torstomp-chunk-id:x\ntorstomp-chunk-index:0\n\nab\x00'
+            b'MESSAGE\nsubscription:1\nmessage-id:2\ndestination:/queue/a\n'
+            b'torstomp-chunk-id:x\ntorstomp-chunk-index:1\n'
+            b'torstomp-chunk-last:true\n\ncd\x00')
+
+        write_calls = [c[0][0] for c in self.stomp.stream.write.call_args_list]
+        self.assertEqual(len(write_calls), 4)
+
+        bodies = [call.split(b'\n\n', 1)[1] for call in write_calls[:2]]
+        self.assertEqual(bodies, [b'ab\x00', b'cd\x00'])
+        self.assertIn(b'destination:/dlq\n', write_calls[0])
+        self.assertIn(b'torstomp-chunk-index:1\n', write_calls[1])
+        self.assertIn(b'torstomp-chunk-last:true\n', write_calls[1])
+        self.assertEqual(write_calls[2:], [
+            b'ACK\nmessage-id:1\nsubscription:1\n\n\x00',
+            b'ACK\nmessage-id:2\nsubscription:1\n\n\x00'])
+
+    @gen_test
+    def test_sink_message_is_nacked_after_backoff(self):
+        self.stomp.stream = MagicMock()
+        self.stomp.subscribe(
+            '/queue/a', ack='client',
+            callback=MagicMock(side_effect=ValueError('boom')),
+            sink_factory=lambda frame: tempfile.TemporaryFile(),
+            retry_policy=RetryPolicy(backoff=10, republish=True))
+
+        self.stomp._on_data(
+            b'MESSAGE\nsubscription:1\nmessage-id:1\ndestination:/queue/a\n'
+            b'torstomp-chunk-id:x\ntorstomp-chunk-index:0\n'
+            b'torstomp-chunk-last:true\n\nab\x00')
+
+        self.assertEqual(self.stomp.stream.write.call_count, 0)
+
+        yield gen.sleep(0.05)
+        self.assertEqual(
+            [c[0][0] for c in self.stomp.stream.write.call_args_list], [
+                b'NACK\nmessage-id:1\nsubscription:1\n\n\x00'])
+
+    def test_callback_error_without_retry_policy_raises(self):
+
+        self.stomp.stream = MagicMock()
+        self.stomp.subscribe(
+            '/queue/a', callback=MagicMock(side_effect=ValueError('boom')))
+
+        with self.assertRaises(ValueError):
+            self.stomp._on_data(
+                b'MESSAGE\nsubscription:1\nmessage-id:1\n\nbody\x00')
+
     def test_set_heart_beat_integration(self):
         self.stomp._set_heart_beat = MagicMock()
         self.stomp._on_data(
@@ -207,6 +1050,26 @@ class TestTorStomp(AsyncTestCase):
 
         self.assertEqual(self.stomp._schedule_heart_beat.call_count, 1)
 
+    def test_message_for_unknown_subscription(self):
+        self.stomp.logger = MagicMock()
+
+        self.stomp._received_message_frame(Frame(
+            'MESSAGE', {'subscription': 'missing', 'message-id': '1'}))
+
+        self.stomp.logger.error.assert_called_once_with(
+            'Not found subscription %s', 'missing')
+
+    def test_do_heart_beat_logs_sampled(self):
+        self.stomp.stream = MagicMock()
+        self.stomp._schedule_heart_beat = MagicMock()
+        self.stomp.logger = self.stomp._heart_beat_log.logger = MagicMock()
+
+        for _ in range(150):
+            self.stomp._do_heart_beat()
+
+        self.assertEqual(self.stomp._heart_beat_log.count, 150)
+        self.assertEqual(self.stomp.logger.log.call_count, 2)
+
     def test_subscription_called(self):
         callback = MagicMock()
 
@@ -285,6 +1148,15 @@ class TestTorStomp(AsyncTestCase):
         self.assertEqual(frame.headers, {'teste': '1'})
         self.assertEqual(frame.body, 'ok')
 
+    def test_add_frame_handler(self):
+        handler = MagicMock()
+        self.stomp.add_frame_handler('RECEIPT', handler)
+
+        self.stomp._on_data(b'RECEIPT\nreceipt-id:77\n\n\x00')
+
+        self.assertEqual(handler.call_count, 1)
+        self.assertEqual(handler.call_args[0][0].headers['receipt-id'], '77')
+
     def test_ack(self):
         self.stomp.stream = MagicMock()
 
@@ -358,3 +1230,141 @@ class TestTorStomp(AsyncTestCase):
             b'destination:/queue/dummyqueue\n'
             b'id:1\n\n'
             b'\x00')
+
+
+class TestTransport(AsyncTestCase):
+
+    def tearDown(self):
+        if getattr(self, 'stomp', None) and self.stomp.connected:
+            self.stomp.stream.close()
+
+        super(TestTransport, self).tearDown()
+
+    def test_default_socket(self):
+        stomp = TorStomp()
+        s = stomp._build_socket()
+        self.addCleanup(s.close)
+
+        self.assertEqual(s.family, socket.AF_INET)
+        self.assertEqual(stomp._address(), ('localhost', 61613))
+        self.assertEqual(
+            s.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY), 0)
+
+    def test_tcp_nodelay_and_socket_options(self):
+        stomp = TorStomp(tcp_nodelay=True, socket_options=[
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)])
+        s = stomp._build_socket()
+        self.addCleanup(s.close)
+
+        self.assertNotEqual(
+            s.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY), 0)
+        self.assertNotEqual(
+            s.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE), 0)
+
+    def test_ipv6_family(self):
+        stomp = TorStomp('::1', family=socket.AF_INET6)
+        s = stomp._build_socket()
+        self.addCleanup(s.close)
+
+        self.assertEqual(s.family, socket.AF_INET6)
+        self.assertEqual(stomp._address(), ('::1', 61613))
+
+    def test_unix_socket_ignores_tcp_nodelay(self):
+        stomp = TorStomp(unix_socket='/tmp/broker.sock', tcp_nodelay=True)
+        s = stomp._build_socket()
+        self.addCleanup(s.close)
+
+        self.assertEqual(s.family, socket.AF_UNIX)
+        self.assertEqual(stomp._address(), '/tmp/broker.sock')
+
+    def test_ssl_options_build_ssl_stream(self):
+        stomp = TorStomp(ssl_options={})
+        stream = stomp._build_io_stream()
+        self.addCleanup(stream.close)
+
+        self.assertIsInstance(stream, SSLIOStream)
+
+    @gen_test
+    def test_read_loop_feeds_protocol(self):
+        stomp = TorStomp()
+        stomp._on_data = MagicMock()
+
+        stream = MagicMock()
+        data = gen.Future()
+        data.set_result(b'CONNECTED\n\n\x00')
+        closed = gen.Future()
+        closed.set_exception(StreamClosedError())
+        stream.read_bytes.side_effect = [data, closed]
+
+        yield stomp._read_loop(stream)
+
+        stomp._on_data.assert_called_once_with(b'CONNECTED\n\n\x00')
+        self.assertEqual(stream.close.call_count, 0)
+
+    @gen_test
+    def test_read_loop_paused_while_dispatcher_is_full(self):
+        stomp = TorStomp(dispatcher=Dispatcher(max_slice=1, max_pending=2))
+        stomp.subscribe('/topic/test', callback=MagicMock())
+
+        stream = MagicMock()
+        data = gen.Future()
+        data.set_result(
+            b'MESSAGE\nsubscription:1\nmessage-id:1\n\na\x00'
+            b'MESSAGE\nsubscription:1\nmessage-id:2\n\nb\x00')
+        closed = gen.Future()
+        closed.set_exception(StreamClosedError())
+        stream.read_bytes.side_effect = [data, closed]
+
+        read_loop = stomp._read_loop(stream)
+
+        self.assertEqual(stream.read_bytes.call_count, 1)
+        self.assertIsNotNone(stomp._reading_paused)
+
+        yield read_loop
+
+        self.assertEqual(stream.read_bytes.call_count, 2)
+        self.assertIsNone(stomp._reading_paused)
+        self.assertEqual(len(stomp._dispatcher), 0)
+
+    @gen_test
+    def test_read_loop_closes_stream_on_error(self):
+        stomp = TorStomp()
+        stomp._on_data = MagicMock(side_effect=ValueError)
+
+        stream = MagicMock()
+        data = gen.Future()
+        data.set_result(b'CONNECTED\n\n\x00')
+        stream.read_bytes.return_value = data
+
+        yield stomp._read_loop(stream)
+
+        stream.close.assert_called_once_with()
+
+    @gen_test
+    def test_connect_over_unix_socket(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'broker.sock')
+
+        broker = FakeBroker(
+            after_connect=b'MESSAGE\nsubscription:1\nmessage-id:1\n\nhi\x00')
+        broker.listen_unix(path)
+
+        callback = MagicMock()
+        self.stomp = TorStomp(unix_socket=path, tcp_nodelay=True)
+        self.stomp.subscribe('/queue/test', callback=callback)
+
+        try:
+            yield self.stomp.connect()
+
+            for _ in range(100):
+                if callback.called:
+                    break
+                yield gen.sleep(0.01)
+        finally:
+            broker.close()
+
+        self.assertTrue(self.stomp.connected)
+        self.assertEqual(callback.call_args[0][1], 'hi')
+        self.assertTrue(broker.received.startswith(
+            b'CONNECT\naccept-version:1.1\n\n\x00'))
@@ -0,0 +1,136 @@
+# -*- coding:utf-8 -*-
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from torstomp.errors import OutboxFullError
+from torstomp.outbox import Outbox
+
+
+class TestOutbox(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'outbox.segment')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_memory_buffer(self):
+        outbox = Outbox()
+
+        outbox.put({}, b'a\x00')
+        outbox.put({}, b'b\x00')
+
+        self.assertEqual(len(outbox), 2)
+        self.assertEqual(list(outbox.batches()), [b'a\x00b\x00'])
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_deduplicate_by_message_id(self):
+        outbox = Outbox()
+
+        self.assertTrue(outbox.put({'message-id': 1}, b'a\x00'))
+        self.assertFalse(outbox.put({'message-id': 1}, b'a\x00'))
+        self.assertTrue(outbox.put({'message-id': 1,
+                                    'torstomp-chunk-index': 1}, b'b\x00'))
+
+        self.assertEqual(list(outbox.batches()), [b'a\x00b\x00'])
+
+    def test_spill_to_disk_keeps_order(self):
+        outbox = Outbox(max_memory=4, path=self.path)
+
+        outbox.put({}, b'a\x00')
+        outbox.put({}, b'bbb\x00')
+        outbox.put({}, b'c\x00')
+
+        self.assertTrue(os.path.exists(self.path))
+        self.assertEqual(len(outbox), 3)
+        self.assertEqual(b''.join(outbox.batches()), b'a\x00bbb\x00c\x00')
+
+    def test_disk_batches_bounded_by_max_memory(self):
+        outbox = Outbox(max_memory=4, path=self.path)
+
+        for body in (b'aaa\x00', b'bbb\x00', b'ccc\x00'):
+            outbox.put({}, body)
+
+        self.assertEqual(list(outbox.batches()),
+                         [b'aaa\x00', b'bbb\x00', b'ccc\x00'])
+
+    def test_full(self):
+        outbox = Outbox(max_memory=2, path=self.path, max_disk=16)
+
+        outbox.put({}, b'a\x00')
+        outbox.put({'message-id': 'x'}, b'bbb\x00')
+
+        with self.assertRaises(OutboxFullError):
+            outbox.put({'message-id': 'y'}, b'ccc\x00')
+
+        self.assertEqual(len(outbox), 2)
+        self.assertNotIn('y', outbox._keys)
+
+    def test_full_without_path(self):
+        outbox = Outbox(max_memory=2)
+
+        with self.assertRaises(OutboxFullError):
+            outbox.put({}, b'abc\x00')
+
+    def test_clear(self):
+        outbox = Outbox(max_memory=2, path=self.path)
+
+        outbox.put({'message-id': 'x'}, b'abc\x00')
+        outbox.clear()
+
+        self.assertEqual(len(outbox), 0)
+        self.assertEqual(list(outbox.batches()), [])
+        self.assertFalse(os.path.exists(self.path))
+        self.assertTrue(outbox.put({'message-id': 'x'}, b'abc\x00'))
+
+    def test_release_keeps_records_put_after_snapshot(self):
+        outbox = Outbox(max_memory=4)
+
+        outbox.put({'message-id': 'x'}, b'a\x00')
+        snapshot = outbox.snapshot()
+        outbox.put({}, b'b\x00')
+
+        self.assertEqual(list(outbox.batches(snapshot)), [b'a\x00'])
+
+        outbox.release(snapshot)
+
+        self.assertEqual(len(outbox), 1)
+        self.assertEqual(list(outbox.batches()), [b'b\x00'])
+        self.assertTrue(outbox.put({'message-id': 'x'}, b'a\x00'))
+
+    def test_release_segment_keeps_records_put_after_snapshot(self):
+        outbox = Outbox(max_memory=0, path=self.path)
+
+        outbox.put({'message-id': 'x'}, b'abc\x00')
+        snapshot = outbox.snapshot()
+        outbox.put({'message-id': 'y'}, b'def\x00')
+
+        self.assertEqual(b''.join(outbox.batches(snapshot)), b'abc\x00')
+
+        outbox.release(snapshot)
+
+        self.assertEqual(len(outbox), 1)
+        self.assertEqual(b''.join(outbox.batches()), b'def\x00')
+        self.assertEqual(outbox._keys, set(['y']))
+
+        outbox.release(outbox.snapshot())
+
+        self.assertEqual(len(outbox), 0)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_reload_segment(self):
+        outbox = Outbox(max_memory=0, path=self.path)
+        outbox.put({'message-id': 'x'}, b'abc\x00')
+        outbox.put({}, b'def\x00')
+
+        with open(self.path, 'ab') as f:
+            f.write(b'\x00\x01')
+
+        outbox = Outbox(max_memory=0, path=self.path)
+
+        self.assertEqual(len(outbox), 2)
+        self.assertFalse(outbox.put({'message-id': 'x'}, b'abc\x00'))
+        self.assertEqual(b''.join(outbox.batches()), b'abc\x00def\x00')
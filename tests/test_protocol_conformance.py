@@ -0,0 +1,164 @@
+# -*- coding:utf-8 -*-
+from unittest import TestCase, skipIf
+
+from mock import patch
+
+from torstomp import protocol
+from torstomp.protocol import CStompProtocol, PyStompProtocol
+
+STREAM = (
+    b'\n'
+    b'CONNECTED\nversion:1.1\nheart-beat:0,0\n\n\x00\n\n'
+    b'MESSAGE\nsubscription:1\nmessage-id:1\ndestination:/queue/a:b\n\n'
+    b'Wilson J\xc3\xbanior\x00'
+    b'MESSAGE\nsubscription:1\nmessage-id:2\ncontent-length:5\n\n'
+    b'a\x00b\x00c\x00\n'
+    b'RECEIPT\nreceipt-id:77\n\n\x00'
+    b'DISCONNECT\n\n\x00'
+    b'ERROR\nmessage:bad\nempty:\n\nline-a\n\nline-b\x00'
+)
+
+
+def describe(frames):
+    return [(frame.command, frame.headers, frame.raw_body)
+            for frame in frames]
+
+
+class ProtocolConformance(object):
+
+    protocol_class = None
+
+    def setUp(self):
+        self.protocol = self.protocol_class()
+
+    def parse(self, *parts):
+        for part in parts:
+            self.protocol.add_data(part)
+
+        return describe(self.protocol.pop_frames())
+
+    def test_stream(self):
+        self.assertEqual(self.parse(STREAM), [
+            (u'CONNECTED', {u'version': u'1.1', u'heart-beat': u'0,0'}, b''),
+            (u'MESSAGE', {u'subscription': u'1', u'message-id': u'1',
+                          u'destination': u'/queue/a:b'},
+             b'Wilson J\xc3\xbanior'),
+            (u'MESSAGE', {u'subscription': u'1', u'message-id': u'2',
+                          u'content-length': u'5'}, b'a\x00b\x00c'),
+            (u'RECEIPT', {u'receipt-id': u'77'}, b''),
+            (u'DISCONNECT', {}, b''),
+            (u'ERROR', {u'message': u'bad', u'empty': u''},
+             b'line-a\n\nline-b'),
+        ])
+
+    def test_stream_split_at_every_offset(self):
+        expected = self.parse(STREAM)
+
+        for offset in range(1, len(STREAM)):
+            self.protocol.reset()
+            self.assertEqual(
+                self.parse(STREAM[:offset], STREAM[offset:]), expected,
+                'split at %d' % offset)
+
+    def test_stream_byte_by_byte(self):
+        expected = self.parse(STREAM)
+
+        self.protocol.reset()
+        parts = [STREAM[i:i + 1] for i in range(len(STREAM))]
+        self.assertEqual(self.parse(*parts), expected)
+
+    def test_stream_heart_beats(self):
+        with patch.object(self.protocol, '_recv_heart_beat') as heart_beat:
+            self.parse(STREAM)
+
+        self.assertEqual(heart_beat.call_count, 4)
+
+    def test_signed_content_length_is_ignored(self):
+        self.assertEqual(
+            self.parse(b'MESSAGE\ncontent-length:+2\n\nbody\x00'),
+            [(u'MESSAGE', {u'content-length': u'+2'}, b'body')])
+
+    def test_first_content_length_wins(self):
+        self.assertEqual(
+            self.parse(b'MESSAGE\ncontent-length:2\ncontent-length:5\n\n'
+                       b'abcdef\x00'),
+            [(u'MESSAGE', {u'content-length': u'5'}, b'ab')])
+
+    def test_first_content_length_wins_for_framing(self):
+        self.assertEqual(
+            self.parse(b'MESSAGE\ncontent-length:3\ncontent-length:1\n\n'
+                       b'a\x00b\x00'),
+            [(u'MESSAGE', {u'content-length': u'1'}, b'a\x00b')])
+
+    def test_non_ascii_digit_content_length_is_ignored(self):
+        self.assertEqual(
+            self.parse(u'MESSAGE\ncontent-length:\u00b2\n\nbody\x00'
+                       .encode('utf-8')),
+            [(u'MESSAGE', {u'content-length': u'\u00b2'}, b'body')])
+
+    def test_frame_without_blank_line(self):
+        self.assertEqual(self.parse(b'CONNECT\naccept-version:1.1\n\x00'),
+                         [(u'CONNECT', {u'accept-version': u'1.1'}, b'')])
+
+    def test_repeated_header_keeps_last(self):
+        self.assertEqual(self.parse(b'MESSAGE\na:1\na:2\n\n\x00'),
+                         [(u'MESSAGE', {u'a': u'2'}, b'')])
+
+    def test_header_without_colon(self):
+        self.assertEqual(self.parse(b'MESSAGE\nflag\n\n\x00'),
+                         [(u'MESSAGE', {u'flag': u''}, b'')])
+
+    def test_invalid_content_length_is_ignored(self):
+        self.assertEqual(
+            self.parse(b'MESSAGE\ncontent-length:abc\n\nbody\x00'),
+            [(u'MESSAGE', {u'content-length': u'abc'}, b'body')])
+
+    def test_invalid_utf8_header(self):
+        with self.assertRaises(UnicodeDecodeError):
+            self.parse(b'MESSAGE\nname:\xc3\n\n\x00')
+
+    def test_binary_body_is_not_decoded(self):
+        self.assertEqual(
+            self.parse(b'MESSAGE\n\n\xff\xfe\x00'),
+            [(u'MESSAGE', {}, b'\xff\xfe')])
+
+    def test_build_frame(self):
+        self.assertEqual(
+            self.protocol.build_frame('SEND', {
+                'destination': '/queue/a',
+                'content-length': 14,
+                u'nome': u'Júnior',
+            }, u'Wilson Júnior'),
+            b'SEND\n'
+            b'content-length:14\n'
+            b'destination:/queue/a\n'
+            b'nome:J\xc3\xbanior\n\n'
+            b'Wilson J\xc3\xbanior\x00')
+
+    def test_build_frame_with_binary_body(self):
+        self.assertEqual(
+            self.protocol.build_frame(u'SEND', {}, b'\x00\xff'),
+            b'SEND\n\n\x00\xff\x00')
+
+    def test_build_frame_without_body(self):
+        self.assertEqual(self.protocol.build_frame('ACK', {'id': 1}),
+                         b'ACK\nid:1\n\n\x00')
+
+    def test_build_and_parse_roundtrip(self):
+        buf = self.protocol.build_frame('MESSAGE', {
+            'content-length': 3, 'subscription': '1'}, b'a\x00b')
+
+        self.assertEqual(self.parse(buf), [(
+            u'MESSAGE', {u'content-length': u'3', u'subscription': u'1'},
+            b'a\x00b')])
+
+
+class TestPyStompProtocol(ProtocolConformance, TestCase):
+
+    protocol_class = PyStompProtocol
+
+
+@skipIf(protocol._speedups is None, 'C speedups are not built')
+class TestCStompProtocol(ProtocolConformance, TestCase):
+
+    protocol_class = CStompProtocol
@@ -0,0 +1,112 @@
+# -*- coding:utf-8 -*-
+import socket
+import subprocess
+import sys
+from unittest import TestCase
+
+from mock import MagicMock, call, patch
+
+from torstomp.errors import StompError
+from torstomp.publish import publish_once
+from torstomp.protocol import StompProtocol
+
+
+class TestPublishOnce(TestCase):
+
+    def setUp(self):
+        patcher = patch('torstomp.publish.socket.create_connection')
+        self.create_connection = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.sock = MagicMock()
+        self.create_connection.return_value = self.sock
+
+    def sent_frames(self):
+        protocol = StompProtocol()
+
+        for args, _ in self.sock.sendall.call_args_list:
+            protocol.add_data(args[0])
+
+        return protocol.pop_frames()
+
+    def test_publish_waits_for_receipt(self):
+        self.sock.recv.side_effect = [
+            b'CONNECTED\nversion:1.1\n\n\x00',
+            b'RECEIPT\nreceipt-id:torstomp-publish-once\n\n\x00',
+        ]
+
+        publish_once('/queue/x', 'hi', headers={'a': '1'}, host='broker',
+                     port=61614, connect_headers={'login': 'user'},
+                     timeout=2000)
+
+        self.create_connection.assert_called_once_with(
+            ('broker', 61614), 2.0)
+
+        connect, send, disconnect = self.sent_frames()
+        self.assertEqual(connect.command, 'CONNECT')
+        self.assertEqual(connect.headers, {
+            'accept-version': '1.1', 'login': 'user'})
+        self.assertEqual(send.command, 'SEND')
+        self.assertEqual(send.headers, {
+            'a': '1', 'destination': '/queue/x', 'content-length': '2',
+            'receipt': 'torstomp-publish-once'})
+        self.assertEqual(send.body, 'hi')
+        self.assertEqual(disconnect.command, 'DISCONNECT')
+        self.assertEqual(self.sock.recv.call_count, 2)
+        self.sock.close.assert_called_once_with()
+
+    def test_publish_without_receipt(self):
+        self.sock.recv.side_effect = [b'CONNECTED\nversion:1.1\n\n\x00']
+
+        publish_once('/queue/x', 'hi', receipt=False)
+
+        connect, send, disconnect = self.sent_frames()
+        self.assertNotIn('receipt', send.headers)
+        self.assertEqual(self.sock.recv.call_count, 1)
+
+    def test_publish_error_frame(self):
+        self.sock.recv.side_effect = [
+            b'ERROR\nmessage:access denied\n\ndetail\x00']
+
+        with self.assertRaises(StompError) as context:
+            publish_once('/queue/x', 'hi')
+
+        self.assertEqual(str(context.exception), 'access denied')
+        self.assertEqual(context.exception.detail, 'detail')
+        self.sock.close.assert_called_once_with()
+
+    def test_publish_connection_closed(self):
+        self.sock.recv.side_effect = [b'CONNECTED\nversion:1.1\n\n\x00', b'']
+
+        with self.assertRaises(socket.error):
+            publish_once('/queue/x', 'hi')
+
+        self.sock.close.assert_called_once_with()
+
+    def test_publish_sets_tcp_nodelay(self):
+        self.sock.recv.side_effect = [b'CONNECTED\n\n\x00']
+
+        publish_once('/queue/x', receipt=False)
+
+        self.assertIn(
+            call(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+            self.sock.setsockopt.call_args_list)
+
+
+class TestLazyImports(TestCase):
+
+    def run_python(self, code):
+        return subprocess.check_output(
+            [sys.executable, '-c', code]).decode('utf-8').strip()
+
+    def test_import_does_not_load_tornado(self):
+        self.assertEqual(self.run_python(
+            'import sys, torstomp; '
+            'from torstomp import publish_once; '
+            'print("tornado" in sys.modules)'), 'False')
+
+    def test_client_is_loaded_on_first_use(self):
+        self.assertEqual(self.run_python(
+            'import sys, torstomp; '
+            'print(torstomp.TorStomp.__module__, "tornado" in sys.modules)'),
+            'torstomp.client True')
@@ -162,6 +162,67 @@ class TestRecvFrame(TestCase):
         self.assertTrue(self.protocol._recv_heart_beat.called)
         self.assertEqual(self.protocol._pending_parts, [])
 
+    def test_content_length_body_with_null_octets(self):
+        stream_data = (
+            b'MESSAGE\n'
+            b'content-length:5\n\n',
+            b'a\x00b',
+            b'\x00c\x00\nERROR\n',
+            b'header:1.0\n\n\x00',
+        )
+
+        for data in stream_data:
+            self.protocol.add_data(data)
+
+        frames = self.protocol.pop_frames()
+        self.assertEqual(len(frames), 2)
+
+        self.assertEqual(frames[0].command, u'MESSAGE')
+        self.assertEqual(frames[0].raw_body, b'a\x00b\x00c')
+
+        self.assertEqual(frames[1].command, u'ERROR')
+        self.assertEqual(frames[1].body, None)
+
+        self.assertEqual(self.protocol._pending_parts, [])
+
+    def test_many_frames_in_one_packet(self):
+        self.protocol._recv_heart_beat = MagicMock()
+        self.protocol.add_data(
+            b'MESSAGE\nmessage-id:1\n\nbody\x00\n' * 5000)
+
+        frames = self.protocol.pop_frames()
+        self.assertEqual(len(frames), 5000)
+        self.assertEqual(frames[-1].body, u'body')
+        self.assertEqual(self.protocol._recv_heart_beat.call_count, 5000)
+        self.assertEqual(self.protocol._pending_parts, [])
+
+    def test_header_value_with_colon(self):
+        self.protocol.add_data(
+            b'MESSAGE\n'
+            b'destination:/queue/a:b\n'
+            b'empty:\n\n\x00')
+
+        frames = self.protocol.pop_frames()
+        self.assertEqual(frames[0].headers,
+                         {u'destination': u'/queue/a:b', u'empty': u''})
+
+    def test_content_length_shorter_than_body(self):
+        self.protocol.add_data(
+            b'MESSAGE\n'
+            b'content-length:2\n\n'
+            b'abcd\x00')
+
+        frames = self.protocol.pop_frames()
+        self.assertEqual(frames[0].raw_body, b'ab')
+
+    def test_frame_without_headers(self):
+        self.protocol.add_data(b'DISCONNECT\n\n\x00')
+
+        frames = self.protocol.pop_frames()
+        self.assertEqual(len(frames), 1)
+        self.assertEqual(frames[0].command, u'DISCONNECT')
+        self.assertEqual(frames[0].headers, {})
+
 
 class TestBuildFrame(TestCase):
 
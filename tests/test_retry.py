@@ -0,0 +1,62 @@
+# -*- coding:utf-8 -*-
+from unittest import TestCase
+
+from torstomp.frame import Frame
+from torstomp.retry import RetryPolicy
+
+
+class TestRetryPolicy(TestCase):
+
+    def test_local_attempt_counter(self):
+        policy = RetryPolicy()
+        frame = Frame('MESSAGE', {'message-id': '1'})
+
+        self.assertEqual(policy.attempt(frame), 1)
+        self.assertEqual(policy.attempt(frame), 2)
+        self.assertEqual(
+            policy.attempt(Frame('MESSAGE', {'message-id': '2'})), 1)
+
+        policy.forget(frame)
+        self.assertEqual(policy.attempt(frame), 1)
+
+    def test_local_attempt_counter_is_bounded(self):
+        policy = RetryPolicy(max_tracked=1)
+
+        policy.attempt(Frame('MESSAGE', {'message-id': '1'}))
+        policy.attempt(Frame('MESSAGE', {'message-id': '2'}))
+
+        self.assertEqual(list(policy._attempts.keys()), ['2'])
+
+    def test_count_header(self):
+        policy = RetryPolicy(count_header='x-delivery-count')
+
+        self.assertEqual(policy.attempt(Frame('MESSAGE', {})), 1)
+        self.assertEqual(policy.attempt(
+            Frame('MESSAGE', {'x-delivery-count': '2'})), 3)
+
+    def test_republish_uses_retry_count_header(self):
+        policy = RetryPolicy(republish=True)
+
+        self.assertEqual(policy.attempt(
+            Frame('MESSAGE', {'torstomp-retry-count': '1'})), 2)
+
+    def test_republish_per_call_uses_retry_count_header(self):
+        policy = RetryPolicy()
+
+        self.assertEqual(policy.attempt(
+            Frame('MESSAGE', {'message-id': '9',
+                              'torstomp-retry-count': '1'}), True), 2)
+        self.assertEqual(dict(policy._attempts), {})
+
+    def test_exhausted(self):
+        policy = RetryPolicy(max_attempts=3)
+
+        self.assertFalse(policy.exhausted(2))
+        self.assertTrue(policy.exhausted(3))
+
+    def test_exponential_backoff(self):
+        policy = RetryPolicy(backoff=100, backoff_factor=2, max_backoff=500)
+
+        self.assertEqual(
+            [policy.delay(attempt) for attempt in range(1, 6)],
+            [100, 200, 400, 500, 500])
@@ -0,0 +1,168 @@
+# -*- coding:utf-8 -*-
+import asyncio
+import os
+import signal
+import threading
+import time
+from unittest import TestCase
+
+from tornado.ioloop import IOLoop
+
+from broker import FakeBroker
+from torstomp.supervisor import ConsumerSpec, Supervisor, _mp
+
+
+def start_broker():
+    broker = FakeBroker(messages=3)
+    started = threading.Event()
+    loops, ports = [], []
+
+    def run():
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        loops.append(IOLoop.current())
+        ports.append(broker.listen_tcp())
+        started.set()
+        loops[0].start()
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    started.wait()
+
+    def stop():
+        loops[0].add_callback(broker.close)
+        loops[0].add_callback(loops[0].stop)
+        thread.join()
+
+    return broker, ports[0], stop
+
+
+def failing_handler(frame, message):
+    if message == '0':
+        raise ValueError(message)
+
+
+def crash_once(counter):
+    def handler(frame, message):
+        with counter.get_lock():
+            counter.value += 1
+            crash = counter.value == 1
+
+        if crash:
+            os._exit(1)
+
+    return handler
+
+
+class TestSupervisor(TestCase):
+
+    def setUp(self):
+        self.broker, port, stop = start_broker()
+        self.addCleanup(stop)
+        self.client_kwargs = {'host': '127.0.0.1', 'port': port}
+
+    def wait_for(self, condition, supervisor=None):
+        for _ in range(250):
+            if supervisor is not None:
+                supervisor.poll()
+
+            if condition():
+                return
+
+            time.sleep(0.02)
+
+        self.fail('condition not reached')
+
+    def test_aggregate_metrics(self):
+        supervisor = Supervisor(
+            [ConsumerSpec('/queue/a', callback=lambda f, m: None),
+             ConsumerSpec('/queue/b', callback=failing_handler,
+                          ack='client')],
+            concurrency=2, client_kwargs=self.client_kwargs,
+            metrics_interval=10)
+
+        supervisor.start()
+
+        try:
+            self.wait_for(
+                lambda: supervisor.metrics()['received']['/queue/b'] == 6,
+                supervisor)
+            metrics = supervisor.metrics()
+        finally:
+            supervisor.stop()
+
+        self.assertEqual(metrics['received'], {'/queue/a': 6, '/queue/b': 6})
+        self.assertEqual(metrics['errors'], {'/queue/a': 0, '/queue/b': 2})
+        self.assertEqual(metrics['workers'], 2)
+        self.assertEqual(metrics['restarts'], 0)
+
+    def test_failed_messages_are_nacked(self):
+        supervisor = Supervisor(
+            [ConsumerSpec('/queue/b', callback=failing_handler,
+                          ack='client')],
+            concurrency=1, client_kwargs=self.client_kwargs)
+
+        supervisor.start()
+
+        try:
+            self.wait_for(lambda: self.broker.commands('NACK'))
+        finally:
+            supervisor.stop()
+
+        nack, = self.broker.commands('NACK')
+        self.assertTrue(nack['message-id'].endswith('-0'))
+
+    def test_restart_crashed_worker(self):
+        counter = _mp.Value('i', 0)
+        supervisor = Supervisor(
+            [ConsumerSpec('/queue/a', callback=crash_once(counter))],
+            concurrency=1, client_kwargs=self.client_kwargs,
+            metrics_interval=10)
+
+        supervisor.start()
+
+        try:
+            self.wait_for(
+                lambda: supervisor.metrics()['received']['/queue/a'] == 3,
+                supervisor)
+            metrics = supervisor.metrics()
+        finally:
+            supervisor.stop()
+
+        self.assertEqual(metrics['restarts'], 1)
+        self.assertEqual(counter.value, 4)
+
+    def test_sigterm_stops_workers(self):
+        supervisor = Supervisor(
+            [ConsumerSpec('/queue/a', callback=lambda f, m: None)],
+            concurrency=2, client_kwargs=self.client_kwargs,
+            poll_interval=0.02)
+
+        process = _mp.Process(target=supervisor.run)
+        process.start()
+
+        try:
+            self.wait_for(lambda: self.broker.connections == 2)
+            os.kill(process.pid, signal.SIGTERM)
+            process.join(5)
+        finally:
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+        self.assertEqual(process.exitcode, 0)
+        self.wait_for(lambda: self.broker.connections == 0)
+
+    def test_worker_subscribes_with_prefetch(self):
+        supervisor = Supervisor(
+            [ConsumerSpec('/queue/a', callback=None, ack='client',
+                          prefetch=10, extra_headers={'x': 'y'})],
+            concurrency=1, prefetch_header='prefetch-count')
+
+        client = supervisor._build_client(None)
+
+        subscription, = client._subscriptions.values()
+        self.assertEqual(subscription.destination, '/queue/a')
+        self.assertEqual(subscription.ack, 'client')
+        self.assertEqual(subscription.extra_headers,
+                         {'x': 'y', 'prefetch-count': 10})
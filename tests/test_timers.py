@@ -0,0 +1,99 @@
+# -*- coding:utf-8 -*-
+from unittest import TestCase
+
+from mock import MagicMock, patch
+
+from torstomp.timers import TimerQueue
+
+
+class TestTimerQueue(TestCase):
+
+    def setUp(self):
+        self.armed = []
+        self.call_later = MagicMock(
+            side_effect=lambda delay, callback: self.armed.append(
+                (delay, callback)) or len(self.armed))
+        self.cancel_timer = MagicMock()
+        self.timers = TimerQueue(self.call_later, self.cancel_timer)
+
+        patcher = patch('torstomp.timers.time')
+        self.time = patcher.start()
+        self.time.monotonic.return_value = 100.0
+        self.addCleanup(patcher.stop)
+
+    def fire(self, now):
+        self.time.monotonic.return_value = now
+        _, callback = self.armed[-1]
+        callback()
+
+    def test_single_loop_timer(self):
+        for delay in (300, 200, 400):
+            self.timers.call_later(delay, MagicMock())
+
+        self.assertEqual(len(self.timers), 3)
+        self.assertEqual(self.call_later.call_count, 2)
+        self.assertEqual(self.armed[-1][0].total_seconds(), 0.2)
+        self.assertEqual(self.cancel_timer.call_count, 1)
+
+    def test_run_due_callbacks_in_order(self):
+        calls = []
+
+        self.timers.call_later(200, calls.append, 'b')
+        self.timers.call_later(100, calls.append, 'a')
+        self.timers.call_later(500, calls.append, 'c')
+
+        self.fire(100.25)
+
+        self.assertEqual(calls, ['a', 'b'])
+        self.assertEqual(len(self.timers), 1)
+        self.assertAlmostEqual(self.armed[-1][0].total_seconds(), 0.25)
+
+        self.fire(100.5)
+        self.assertEqual(calls, ['a', 'b', 'c'])
+        self.assertEqual(len(self.timers), 0)
+
+    def test_cancel(self):
+        callback = MagicMock()
+
+        handle = self.timers.call_later(100, callback)
+        self.timers.call_later(200, MagicMock())
+        handle.cancel()
+        handle.cancel()
+
+        self.assertEqual(len(self.timers), 1)
+
+        self.fire(100.3)
+        self.assertEqual(callback.call_count, 0)
+        self.assertEqual(len(self.timers._heap), 0)
+
+    def test_compact_cancelled_timers(self):
+        handles = [self.timers.call_later(100 + index, MagicMock())
+                   for index in range(10)]
+
+        for handle in handles[1:]:
+            handle.cancel()
+
+        self.timers.call_later(50, MagicMock())
+
+        self.assertEqual(len(self.timers._heap), 2)
+
+    def test_callback_error_does_not_stop_queue(self):
+        callback = MagicMock()
+
+        self.timers.call_later(100, MagicMock(side_effect=ValueError()))
+        self.timers.call_later(100, callback)
+
+        self.fire(100.1)
+        self.assertEqual(callback.call_count, 1)
+
+    def test_cancel_compacts_without_arming(self):
+        self.timers.call_later(100, MagicMock())
+        handles = [self.timers.call_later(1000 + index, MagicMock())
+                   for index in range(10)]
+
+        for handle in handles:
+            handle.cancel()
+
+        self.assertLessEqual(len(self.timers._heap), 6)
+        self.assertEqual(len(self.timers), 1)
+        self.assertEqual(self.call_later.call_count, 1)
@@ -0,0 +1,488 @@
+/*
+ * Optional C implementation of the StompProtocol hot paths.
+ *
+ * parse_frame(data, headers_end) -> (command, headers, body)
+ * scan_frames(data, start, frame_class) -> (frames, heart_beats, offset)
+ * build_frame(command, headers, body) -> bytes
+ *
+ * Both must behave exactly like the pure Python code in protocol.py;
+ * tests/test_protocol_conformance.py runs the same suite against both.
+ */
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <string.h>
+
+static const char CONTENT_LENGTH[] = "content-length";
+
+typedef struct {
+    PyObject *bytes;
+    Py_ssize_t len;
+    Py_ssize_t cap;
+} writer_t;
+
+static int
+writer_init(writer_t *w, Py_ssize_t cap)
+{
+    w->bytes = PyBytes_FromStringAndSize(NULL, cap);
+    w->len = 0;
+    w->cap = cap;
+    return w->bytes == NULL ? -1 : 0;
+}
+
+static int
+writer_write(writer_t *w, const char *data, Py_ssize_t size)
+{
+    if (w->len + size > w->cap) {
+        Py_ssize_t cap = w->cap * 2;
+
+        if (cap < w->len + size) {
+            cap = w->len + size;
+        }
+
+        if (_PyBytes_Resize(&w->bytes, cap) < 0) {
+            return -1;
+        }
+
+        w->cap = cap;
+    }
+
+    memcpy(PyBytes_AS_STRING(w->bytes) + w->len, data, size);
+    w->len += size;
+    return 0;
+}
+
+/* write str(obj) as UTF-8, or the raw bytes when allowed */
+static int
+writer_write_object(writer_t *w, PyObject *obj, int raw_bytes)
+{
+    const char *data;
+    Py_ssize_t size;
+    PyObject *text;
+    int result;
+
+    if (raw_bytes && PyBytes_Check(obj)) {
+        return writer_write(w, PyBytes_AS_STRING(obj), PyBytes_GET_SIZE(obj));
+    }
+
+    if (PyUnicode_Check(obj)) {
+        data = PyUnicode_AsUTF8AndSize(obj, &size);
+        return data == NULL ? -1 : writer_write(w, data, size);
+    }
+
+    text = PyObject_Str(obj);
+    if (text == NULL) {
+        return -1;
+    }
+
+    data = PyUnicode_AsUTF8AndSize(text, &size);
+    result = data == NULL ? -1 : writer_write(w, data, size);
+    Py_DECREF(text);
+    return result;
+}
+
+static PyObject *
+writer_finish(writer_t *w)
+{
+    if (_PyBytes_Resize(&w->bytes, w->len) < 0) {
+        return NULL;
+    }
+
+    return w->bytes;
+}
+
+static int
+parse_length(const char *data, Py_ssize_t size, Py_ssize_t *length)
+{
+    Py_ssize_t value = 0;
+    Py_ssize_t i;
+
+    if (size == 0) {
+        return -1;
+    }
+
+    for (i = 0; i < size; i++) {
+        if (data[i] < '0' || data[i] > '9' ||
+                value > (PY_SSIZE_T_MAX - 9) / 10) {
+            return -1;
+        }
+
+        value = value * 10 + (data[i] - '0');
+    }
+
+    *length = value;
+    return 0;
+}
+
+/* same rules as PyStompProtocol._proccess_frame */
+static PyObject *
+parse_frame_impl(const char *data, Py_ssize_t size, Py_ssize_t headers_end,
+                 PyObject *frame_class)
+{
+    const char *block_end, *body_start, *line, *eol, *colon;
+    Py_ssize_t body_size, length;
+    int seen_length = 0;
+    PyObject *command = NULL, *headers = NULL, *body = NULL;
+    PyObject *key = NULL, *value = NULL, *result = NULL;
+
+    if (headers_end < 0 || headers_end > size) {
+        block_end = data + size;
+
+        while (block_end > data && block_end[-1] == '\n') {
+            block_end--;
+        }
+
+        body_start = data + size;
+    } else {
+        block_end = data + headers_end;
+        body_start = block_end + 2;
+
+        if (body_start > data + size) {
+            body_start = data + size;
+        }
+    }
+
+    body_size = data + size - body_start;
+
+    eol = memchr(data, '\n', block_end - data);
+    if (eol == NULL) {
+        eol = block_end;
+    }
+
+    command = PyUnicode_DecodeUTF8(data, eol - data, NULL);
+    if (command == NULL) {
+        goto done;
+    }
+
+    headers = PyDict_New();
+    if (headers == NULL) {
+        goto done;
+    }
+
+    line = eol < block_end ? eol + 1 : block_end;
+
+    while (line < block_end) {
+        eol = memchr(line, '\n', block_end - line);
+        if (eol == NULL) {
+            eol = block_end;
+        }
+
+        colon = memchr(line, ':', eol - line);
+        if (colon == NULL) {
+            colon = eol;
+        }
+
+        key = PyUnicode_DecodeUTF8(line, colon - line, NULL);
+        if (key == NULL) {
+            goto done;
+        }
+
+        if (colon < eol) {
+            value = PyUnicode_DecodeUTF8(colon + 1, eol - colon - 1, NULL);
+        } else {
+            value = PyUnicode_FromStringAndSize(NULL, 0);
+        }
+
+        if (value == NULL || PyDict_SetItem(headers, key, value) < 0) {
+            goto done;
+        }
+
+        /* the first content-length is the one used for framing */
+        if (!seen_length && colon - line == sizeof(CONTENT_LENGTH) - 1 &&
+                memcmp(line, CONTENT_LENGTH, sizeof(CONTENT_LENGTH) - 1) == 0) {
+            seen_length = 1;
+
+            if (parse_length(colon + 1, eol - colon - 1, &length) == 0 &&
+                    length < body_size) {
+                body_size = length;
+            }
+        }
+
+        Py_CLEAR(key);
+        Py_CLEAR(value);
+        line = eol + 1;
+    }
+
+    body = PyBytes_FromStringAndSize(body_start, body_size);
+    if (body == NULL) {
+        goto done;
+    }
+
+    if (frame_class == NULL) {
+        result = PyTuple_Pack(3, command, headers, body);
+    } else {
+        /* Frame(command, headers, body=None, raw_body=body) */
+        result = PyObject_CallFunctionObjArgs(
+            frame_class, command, headers, Py_None, body, NULL);
+    }
+
+done:
+    Py_XDECREF(key);
+    Py_XDECREF(value);
+    Py_XDECREF(command);
+    Py_XDECREF(headers);
+    Py_XDECREF(body);
+    return result;
+}
+
+static Py_ssize_t
+find_headers_end(const char *data, Py_ssize_t size)
+{
+    const char *p = data, *end = data + size;
+
+    while (p < end) {
+        p = memchr(p, '\n', end - p);
+
+        if (p == NULL || p + 1 >= end) {
+            return -1;
+        }
+
+        if (p[1] == '\n') {
+            return p - data;
+        }
+
+        p++;
+    }
+
+    return -1;
+}
+
+/* same rules as PyStompProtocol._frame_size, -1 without content-length */
+static Py_ssize_t
+frame_size(const char *data, Py_ssize_t headers_end)
+{
+    const char *line = data, *block_end = data + headers_end, *eol;
+    Py_ssize_t length;
+    const Py_ssize_t name_size = sizeof(CONTENT_LENGTH) - 1;
+
+    if (headers_end < 0) {
+        return -1;
+    }
+
+    while (line < block_end) {
+        eol = memchr(line, '\n', block_end - line);
+        if (eol == NULL) {
+            eol = block_end;
+        }
+
+        if (line != data && eol - line > name_size &&
+                memcmp(line, CONTENT_LENGTH, name_size) == 0 &&
+                line[name_size] == ':') {
+            if (parse_length(line + name_size + 1,
+                             eol - line - name_size - 1, &length) < 0 ||
+                    length > PY_SSIZE_T_MAX - headers_end - 2) {
+                return -1;
+            }
+
+            return headers_end + 2 + length;
+        }
+
+        line = eol + 1;
+    }
+
+    return -1;
+}
+
+static PyObject *
+parse_frame(PyObject *self, PyObject *args)
+{
+    Py_buffer view;
+    Py_ssize_t headers_end;
+    PyObject *result;
+
+    if (!PyArg_ParseTuple(args, "y*n", &view, &headers_end)) {
+        return NULL;
+    }
+
+    result = parse_frame_impl(view.buf, view.len, headers_end, NULL);
+    PyBuffer_Release(&view);
+    return result;
+}
+
+static PyObject *
+scan_frames(PyObject *self, PyObject *args)
+{
+    Py_buffer view;
+    Py_ssize_t start, heart_beats = 0, headers_end, size;
+    PyObject *frame_class, *frames = NULL, *frame, *result = NULL;
+    const char *data, *p, *end, *eof;
+
+    if (!PyArg_ParseTuple(args, "y*nO", &view, &start, &frame_class)) {
+        return NULL;
+    }
+
+    data = view.buf;
+    end = data + view.len;
+    p = data + (start < 0 ? 0 : (start > view.len ? view.len : start));
+
+    frames = PyList_New(0);
+    if (frames == NULL) {
+        goto done;
+    }
+
+    for (;;) {
+        while (p < end && *p == '\n') {
+            heart_beats++;
+            p++;
+        }
+
+        if (p >= end) {
+            break;
+        }
+
+        eof = memchr(p, '\0', end - p);
+        if (eof == NULL) {
+            break;
+        }
+
+        headers_end = find_headers_end(p, eof - p);
+        size = frame_size(p, headers_end);
+
+        if (size > eof - p) {
+            /* the NULL octet belongs to a body with content-length */
+            if (size >= end - p) {
+                break;
+            }
+
+            eof = p + size;
+        }
+
+        frame = parse_frame_impl(p, eof - p, headers_end, frame_class);
+        if (frame == NULL) {
+            goto done;
+        }
+
+        if (PyList_Append(frames, frame) < 0) {
+            Py_DECREF(frame);
+            goto done;
+        }
+
+        Py_DECREF(frame);
+        p = eof;
+
+        if (p < end && *p == '\0') {
+            p++;
+        }
+    }
+
+    result = Py_BuildValue("(Onn)", frames, heart_beats, p - data);
+
+done:
+    Py_XDECREF(frames);
+    PyBuffer_Release(&view);
+    return result;
+}
+
+static PyObject *
+build_frame(PyObject *self, PyObject *args)
+{
+    PyObject *command, *headers, *body = NULL;
+    PyObject *items = NULL, *item;
+    Py_buffer view;
+    Py_ssize_t i, body_size = 0;
+    writer_t w = {NULL, 0, 0};
+    int has_view = 0;
+
+    if (!PyArg_ParseTuple(args, "OO|O", &command, &headers, &body)) {
+        return NULL;
+    }
+
+    if (body != NULL && PyUnicode_Check(body)) {
+        if (PyUnicode_AsUTF8AndSize(body, &body_size) == NULL) {
+            return NULL;
+        }
+    } else if (body != NULL) {
+        if (PyObject_GetBuffer(body, &view, PyBUF_SIMPLE) < 0) {
+            return NULL;
+        }
+
+        has_view = 1;
+        body_size = view.len;
+    }
+
+    items = PyMapping_Items(headers);
+    if (items == NULL || PyList_Sort(items) < 0) {
+        goto error;
+    }
+
+    if (writer_init(&w, 64 + 32 * PyList_GET_SIZE(items) + body_size) < 0) {
+        goto error;
+    }
+
+    if (writer_write_object(&w, command, 1) < 0 ||
+            writer_write(&w, "\n", 1) < 0) {
+        goto error;
+    }
+
+    for (i = 0; i < PyList_GET_SIZE(items); i++) {
+        item = PyList_GET_ITEM(items, i);
+
+        if (!PyTuple_Check(item) || PyTuple_GET_SIZE(item) != 2) {
+            PyErr_SetString(PyExc_TypeError, "headers must be a mapping");
+            goto error;
+        }
+
+        if (writer_write_object(&w, PyTuple_GET_ITEM(item, 0), 0) < 0 ||
+                writer_write(&w, ":", 1) < 0 ||
+                writer_write_object(&w, PyTuple_GET_ITEM(item, 1), 0) < 0 ||
+                writer_write(&w, "\n", 1) < 0) {
+            goto error;
+        }
+    }
+
+    if (writer_write(&w, "\n", 1) < 0) {
+        goto error;
+    }
+
+    if (has_view) {
+        if (writer_write(&w, view.buf, view.len) < 0) {
+            goto error;
+        }
+
+        PyBuffer_Release(&view);
+        has_view = 0;
+    } else if (body != NULL) {
+        if (writer_write_object(&w, body, 0) < 0) {
+            goto error;
+        }
+    }
+
+    if (writer_write(&w, "\0", 1) < 0) {
+        goto error;
+    }
+
+    Py_DECREF(items);
+    return writer_finish(&w);
+
+error:
+    if (has_view) {
+        PyBuffer_Release(&view);
+    }
+
+    Py_XDECREF(items);
+    Py_XDECREF(w.bytes);
+    return NULL;
+}
+
+static PyMethodDef speedups_methods[] = {
+    {"parse_frame", parse_frame, METH_VARARGS,
+     "Parse a frame without its NULL terminator."},
+    {"scan_frames", scan_frames, METH_VARARGS,
+     "Parse every complete frame of data from start."},
+    {"build_frame", build_frame, METH_VARARGS,
+     "Serialize a frame, headers sorted by name."},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef speedups_module = {
+    PyModuleDef_HEAD_INIT,
+    "torstomp._speedups",
+    NULL,
+    -1,
+    speedups_methods
+};
+
+PyMODINIT_FUNC
+PyInit__speedups(void)
+{
+    return PyModule_Create(&speedups_module);
+}
@@ -0,0 +1,122 @@
+# -*- coding:utf-8 -*-
+import asyncio
+
+from tornado.netutil import ssl_options_to_context
+
+from torstomp.client import TorStomp
+
+
+class _StompStreamProtocol(asyncio.Protocol):
+
+    def __init__(self, client):
+        self._client = client
+        self._drain_waiter = None
+
+    def data_received(self, data):
+        self._client._on_data(data)
+
+    def connection_lost(self, exc):
+        self.resume_writing()
+        self._client._on_disconnect_socket()
+
+    def pause_writing(self):
+        if self._drain_waiter is None:
+            self._drain_waiter = self._client._get_loop().create_future()
+
+    def resume_writing(self):
+        waiter, self._drain_waiter = self._drain_waiter, None
+
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+
+class AioStomp(TorStomp):
+
+    def __init__(self, *args, loop=None, **kwargs):
+        super(AioStomp, self).__init__(*args, **kwargs)
+        self._loop = loop
+        self._transport = None
+        self._stream_protocol = None
+
+    async def connect(self):
+        loop = self._get_loop()
+        sock = self._build_socket()
+        sock.setblocking(False)
+
+        ssl_context = server_hostname = None
+        if self._ssl_options is not None:
+            ssl_context = ssl_options_to_context(
+                self._ssl_options, server_side=False)
+            server_hostname = self.host
+
+        try:
+            await loop.sock_connect(sock, self._address())
+            self._transport, self._stream_protocol = \
+                await loop.create_connection(
+                    lambda: _StompStreamProtocol(self), sock=sock,
+                    ssl=ssl_context, server_hostname=server_hostname)
+            self.logger.info('Stomp connection estabilished')
+
+            # the dispatcher is still full of messages from the last one
+            if self._reading_paused:
+                self._transport.pause_reading()
+        except OSError as error:
+            sock.close()
+            self.logger.error(
+                '[attempt: %d] Connect error: %s', self._reconnect_attempts,
+                error)
+            self._schedule_reconnect()
+            return
+
+        self._set_transport_connected()
+
+        self._send_frame('CONNECT', self._connect_headers)
+
+        for subscription in list(self._subscriptions.values()):
+            self._send_subscribe_frame(subscription)
+
+        if self._outbox is not None:
+            await self._flush_outbox()
+
+        if self._on_connect:
+            self._on_connect()
+
+    def _get_loop(self):
+        return self._loop or asyncio.get_event_loop()
+
+    def _write(self, buf):
+        self._transport.write(buf)
+
+        # a future while the transport buffer is above its high-water mark
+        return self._stream_protocol._drain_waiter
+
+    def _close_transport(self):
+        self._transport.close()
+
+    def _pause_reading(self):
+        self._reading_paused = True
+
+        if self._transport is not None:
+            self._transport.pause_reading()
+
+    def _resume_reading(self):
+        self._reading_paused = None
+
+        if self._transport is not None:
+            self._transport.resume_reading()
+
+    def _call_later(self, delay, callback, *args):
+        return self._get_loop().call_later(
+            delay.total_seconds(), self._run_callback, callback, args)
+
+    def _cancel_timer(self, handler):
+        handler.cancel()
+
+    def _call_soon(self, callback, *args):
+        self._get_loop().call_soon(callback, *args)
+
+    def _run_callback(self, callback, args):
+        result = callback(*args)
+
+        if asyncio.iscoroutine(result):
+            self._get_loop().create_task(result)
@@ -0,0 +1,167 @@
+# -*- coding:utf-8 -*-
+import logging
+import uuid
+
+from collections import OrderedDict
+
+from torstomp.frame import Frame
+
+CHUNK_ID = 'torstomp-chunk-id'
+CHUNK_INDEX = 'torstomp-chunk-index'
+CHUNK_LAST = 'torstomp-chunk-last'
+
+CHUNK_HEADERS = (CHUNK_ID, CHUNK_INDEX, CHUNK_LAST)
+
+
+def iter_chunks(body, chunk_size):
+    if hasattr(body, 'read'):
+        while True:
+            chunk = body.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        for offset in range(0, len(body), chunk_size):
+            yield body[offset:offset + chunk_size]
+
+
+def chunk_frames(body, headers, chunk_size, chunk_id=None):
+    chunk_id = chunk_id or uuid.uuid4().hex
+    chunks = iter_chunks(body, chunk_size)
+    chunk = next(chunks, b'')
+    index = 0
+
+    while True:
+        next_chunk = next(chunks, None)
+
+        chunk_headers = dict(headers)
+        chunk_headers[CHUNK_ID] = chunk_id
+        chunk_headers[CHUNK_INDEX] = index
+        chunk_headers['content-length'] = len(chunk)
+
+        if next_chunk is None:
+            chunk_headers[CHUNK_LAST] = 'true'
+            yield chunk_headers, chunk
+            return
+
+        yield chunk_headers, chunk
+        chunk = next_chunk
+        index += 1
+
+
+class _Transfer(object):
+
+    def __init__(self, sink, headers):
+        self.sink = sink
+        self.headers = headers
+        self.parts = [] if sink is None else None
+        self.next_index = 0
+        self.last_index = None
+        self.out_of_order = {}
+        self.message_ids = []
+        self.chunk_size = 0
+
+    def write(self, chunk):
+        self.chunk_size = max(self.chunk_size, len(chunk))
+
+        if self.sink is None:
+            self.parts.append(chunk)
+        else:
+            self.sink.write(chunk)
+
+        self.next_index += 1
+
+
+class ChunkAssembler(object):
+
+    def __init__(self, sink_factory=None, max_transfers=64, on_drop=None,
+                 log_name='TorStomp'):
+        self._sink_factory = sink_factory
+        self._max_transfers = max_transfers
+        self._on_drop = on_drop
+        self._transfers = OrderedDict()
+        self.logger = logging.getLogger(log_name)
+
+    @staticmethod
+    def is_chunk(frame):
+        return CHUNK_ID in frame.headers
+
+    def add(self, frame):
+        chunk_id = frame.headers[CHUNK_ID]
+        index = int(frame.headers[CHUNK_INDEX])
+
+        transfer = self._transfers.get(chunk_id)
+
+        if transfer is None:
+            transfer = self._start_transfer(chunk_id, frame)
+
+        transfer.message_ids.append(frame.headers.get('message-id'))
+
+        if frame.headers.get(CHUNK_LAST) == 'true':
+            transfer.last_index = index
+
+        if index == transfer.next_index:
+            transfer.write(frame.raw_body or b'')
+
+            while transfer.next_index in transfer.out_of_order:
+                transfer.write(
+                    transfer.out_of_order.pop(transfer.next_index))
+
+        elif index > transfer.next_index:
+            transfer.out_of_order[index] = frame.raw_body or b''
+
+        if transfer.last_index is None or \
+                transfer.next_index <= transfer.last_index:
+            return None
+
+        del self._transfers[chunk_id]
+        return self._complete(transfer, frame)
+
+    def _start_transfer(self, chunk_id, frame):
+        if len(self._transfers) >= self._max_transfers:
+            expired_id, expired = self._transfers.popitem(last=False)
+            self.logger.warning(
+                'Dropping incomplete chunked message %s', expired_id)
+            self._drop(expired)
+
+        sink = None
+        if self._sink_factory is not None:
+            sink = self._sink_factory(frame)
+
+        transfer = _Transfer(sink, frame.headers)
+        self._transfers[chunk_id] = transfer
+        return transfer
+
+    def _drop(self, transfer):
+        if transfer.sink is not None:
+            transfer.sink.close()
+
+        if self._on_drop is not None:
+            # a frame carrying the ids of the chunks received so far
+            frame = Frame('MESSAGE', transfer.headers)
+            frame.message_ids = transfer.message_ids
+            self._on_drop(frame)
+
+    def _complete(self, transfer, last_frame):
+        headers = dict(
+            (key, value) for key, value in last_frame.headers.items()
+            if key not in CHUNK_HEADERS and key != 'content-length')
+
+        if transfer.sink is None:
+            raw_body = b''.join(transfer.parts)
+            transfer.parts = None
+        else:
+            raw_body = None
+
+            # the callback reads the sink from the start
+            try:
+                transfer.sink.seek(0)
+            except (AttributeError, IOError, ValueError):
+                pass
+
+        frame = Frame(last_frame.command, headers, raw_body=raw_body)
+        frame.sink = transfer.sink
+        frame.message_ids = transfer.message_ids
+        frame.chunk_size = transfer.chunk_size
+
+        return frame
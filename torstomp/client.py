@@ -0,0 +1,797 @@
+# -*- coding:utf-8 -*-
+import socket
+import logging
+import datetime
+import uuid
+
+from tornado.iostream import IOStream, SSLIOStream, StreamClosedError
+from tornado.ioloop import IOLoop
+from tornado import gen
+
+from collections import OrderedDict
+from datetime import timedelta
+
+from torstomp.chunking import ChunkAssembler, chunk_frames
+from torstomp.protocol import StompProtocol
+from torstomp.errors import StompError
+from torstomp.log import SampledLog, start_background_logging
+from torstomp.subscription import Subscription
+from torstomp.retry import RETRY_COUNT
+from torstomp.timers import TimerQueue
+
+
+class TorStomp(object):
+
+    VERSION = '1.1'
+    MESSAGE_ONLY_HEADERS = frozenset([
+        'message-id', 'subscription', 'destination', 'ack',
+        'content-length', 'redelivered'])
+
+    def __init__(self, host='localhost', port=61613, connect_headers={},
+                 on_error=None, on_disconnect=None, on_connect=None,
+                 reconnect_max_attempts=-1, reconnect_timeout=1000,
+                 log_name='TorStomp', codecs=None, chunk_size=None,
+                 reply_destination=None, outbox=None, dispatcher=None,
+                 delay_header=None, unix_socket=None, family=socket.AF_INET,
+                 tcp_nodelay=False, socket_options=(), ssl_options=None,
+                 background_logging=False):
+
+        self.host = host
+        self.port = port
+        self.logger = logging.getLogger(log_name)
+
+        if background_logging:
+            start_background_logging(log_name)
+
+        self._connect_headers = connect_headers
+        self._connect_headers['accept-version'] = self.VERSION
+        self._heart_beat_handler = None
+        self._heart_beat_log = SampledLog(self.logger, 'Heartbeats sent: %d')
+        self.connected = False
+        self.disconnected_date = None
+        self._disconnecting = False
+        self._protocol = StompProtocol(log_name=log_name)
+        self._subscriptions = {}
+        self._last_subscribe_id = 0
+        self._on_error = on_error
+        self._on_disconnect = on_disconnect
+        self._on_connect = on_connect
+        self._codecs = codecs
+        self._chunk_size = chunk_size
+        self._log_name = log_name
+
+        self._unix_socket = unix_socket
+        self._family = family
+        self._tcp_nodelay = tcp_nodelay
+        self._socket_options = list(socket_options)
+        self._ssl_options = ssl_options
+
+        self._reply_prefix = uuid.uuid4().hex
+        self._reply_destination = reply_destination or \
+            '/temp-queue/torstomp-%s' % self._reply_prefix
+        self._reply_subscription = None
+        self._pending_requests = {}
+        self._last_request_id = 0
+        self._outbox = outbox
+        self._flushing = False
+        self._delay_header = delay_header
+        self._timers = TimerQueue(
+            self._call_later, self._cancel_timer, log_name=log_name)
+
+        self._frame_handlers = {
+            'MESSAGE': self._route_message_frame,
+            'CONNECTED': self._set_connected,
+            'ERROR': self._received_error_frame,
+        }
+
+        self._batches = OrderedDict()
+        self._reading_paused = None
+        self._dispatcher = dispatcher
+        if dispatcher is not None:
+            dispatcher.bind(self._dispatch_message_frame, self._call_soon,
+                            self._dispatch_batches, self._pause_reading,
+                            self._resume_reading)
+
+        self._reconnect_max_attempts = reconnect_max_attempts
+        self._reconnect_timeout = timedelta(milliseconds=reconnect_timeout)
+        self._reconnect_attempts = 0
+
+    @gen.coroutine
+    def connect(self):
+        self.stream = self._build_io_stream()
+
+        try:
+            yield self.stream.connect(
+                self._address(), server_hostname=self.host)
+            self.logger.info('Stomp connection estabilished')
+        except socket.error as error:
+            self.logger.error(
+                '[attempt: %d] Connect error: %s', self._reconnect_attempts,
+                error)
+            self._schedule_reconnect()
+            return
+
+        self.stream.set_close_callback(self._on_disconnect_socket)
+        self._read_loop(self.stream)
+
+        self._set_transport_connected()
+
+        yield self._send_frame('CONNECT', self._connect_headers)
+
+        for subscription in self._subscriptions.values():
+            yield self._send_subscribe_frame(subscription)
+
+        if self._outbox is not None:
+            yield self._flush_outbox()
+
+        if self._on_connect:
+            self._on_connect()
+
+    def subscribe(self, destination, ack='auto', extra_headers={},
+                  callback=None, codecs=None, chunked=False,
+                  sink_factory=None, dedup=None, dedup_header='message-id',
+                  priority=0, weight=1, batch_callback=None, batch_size=100,
+                  retry_policy=None):
+
+        self._last_subscribe_id += 1
+
+        assembler = None
+        if chunked or sink_factory is not None:
+            # chunks of a dropped transfer are redelivered by the broker
+            assembler = ChunkAssembler(
+                sink_factory=sink_factory,
+                on_drop=self.nack if ack != 'auto' else None,
+                log_name=self._log_name)
+
+        subscription = Subscription(
+            destination=destination,
+            id=self._last_subscribe_id,
+            ack=ack,
+            extra_headers=extra_headers,
+            callback=callback,
+            codecs=codecs,
+            assembler=assembler,
+            dedup=dedup,
+            dedup_header=dedup_header,
+            priority=priority,
+            weight=weight,
+            batch_callback=batch_callback,
+            batch_size=batch_size,
+            retry_policy=retry_policy)
+
+        self._subscriptions[str(self._last_subscribe_id)] = subscription
+
+        if self.connected:
+            self._send_subscribe_frame(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription_id = str(subscription.id)
+
+        if subscription_id in self._subscriptions.keys():
+            self._send_unsubscribe_frame(subscription)
+            del self._subscriptions[subscription_id]
+
+    def send(self, destination, body='', headers={}, send_content_length=True,
+             delay=None):
+        headers = dict(headers)
+
+        if delay:
+            if self._delay_header is None:
+                return self._timers.call_later(
+                    delay, self.send, destination, body, headers,
+                    send_content_length)
+
+            headers[self._delay_header] = int(delay)
+
+        headers['destination'] = destination
+
+        if self._codecs is not None and body is not None and body != '':
+            body = self._codecs.encode(body, headers)
+
+            # compressed bodies may contain NULL octets
+            send_content_length = send_content_length or \
+                'content-encoding' in headers
+
+        if body:
+            body = self._protocol._encode(body)
+
+            if self._chunk_size and len(body) > self._chunk_size:
+                return self._send_chunks(body, headers, self._chunk_size)
+
+            # ActiveMQ determines the type of a message by the
+            # inclusion of the content-length header
+            if send_content_length:
+                headers['content-length'] = len(body)
+
+        return self._send_message_frame(headers, body)
+
+    def send_at(self, when, destination, body='', headers={},
+                send_content_length=True):
+        delay = (when - datetime.datetime.now()).total_seconds() * 1000
+
+        return self.send(destination, body, headers, send_content_length,
+                         delay=max(delay, 0))
+
+    def send_chunked(self, destination, body, headers={}, chunk_size=None):
+        headers = dict(headers)
+        headers['destination'] = destination
+
+        if not hasattr(body, 'read'):
+            if self._codecs is not None:
+                body = self._codecs.encode(body, headers)
+
+            body = self._protocol._encode(body)
+
+        return self._send_chunks(body, headers, chunk_size or self._chunk_size)
+
+    @gen.coroutine
+    def _send_chunks(self, body, headers, chunk_size):
+        for chunk_headers, chunk in chunk_frames(body, headers, chunk_size):
+            yield self._send_message_frame(chunk_headers, chunk)
+
+    def request(self, destination, body='', headers={}, timeout=30000):
+        if self._reply_subscription is None:
+            self._reply_subscription = self.subscribe(
+                self._reply_destination, callback=self._received_reply)
+
+        self._last_request_id += 1
+        correlation_id = '%s-%d' % (self._reply_prefix, self._last_request_id)
+
+        future = gen.Future()
+        timeout_handler = None
+
+        if timeout:
+            timeout_handler = self._timers.call_later(
+                timeout, self._request_timeout, correlation_id)
+
+        self._pending_requests[correlation_id] = (future, timeout_handler)
+
+        headers = dict(headers)
+        headers['reply-to'] = self._reply_destination
+        headers['correlation-id'] = correlation_id
+
+        try:
+            self.send(destination, body, headers)
+        except Exception:
+            self._pop_request(correlation_id)
+            raise
+
+        return future
+
+    def reply(self, frame, body='', headers={}):
+        headers = dict(headers)
+        headers['correlation-id'] = frame.headers['correlation-id']
+
+        return self.send(frame.headers['reply-to'], body, headers)
+
+    def add_frame_handler(self, command, handler):
+        self._frame_handlers[command] = handler
+
+    def ack(self, frame):
+        return self._send_ack_frames('ACK', frame)
+
+    def nack(self, frame):
+        return self._send_ack_frames('NACK', frame)
+
+    def reject(self, frame, reason=None):
+        subscription = self._subscriptions.get(
+            frame.headers.get('subscription'))
+        policy = subscription and subscription.retry_policy
+
+        frame.nacked = True
+
+        if policy is None:
+            return self.nack(frame)
+
+        # a body streamed to a sink can't be published again, only the
+        # broker can redeliver its chunks
+        streamed = frame.sink is not None
+
+        if streamed and subscription.ack == 'auto':
+            self.logger.error(
+                "Message %s was streamed to a sink and can't be retried",
+                frame.headers.get('message-id'))
+            return
+
+        republish = not streamed and \
+            (policy.republish or subscription.ack == 'auto')
+        attempt = policy.attempt(frame, republish)
+
+        if policy.exhausted(attempt) and streamed:
+            self.logger.warning(
+                'Message %s failed %d times and was streamed to a sink, '
+                'nacking it', frame.headers.get('message-id'), attempt)
+
+            return self._send_ack_frames('NACK', frame)
+
+        if policy.exhausted(attempt):
+            policy.forget(frame)
+
+            if policy.dead_letter:
+                self.logger.warning(
+                    'Message %s failed %d times, sending to %s',
+                    frame.headers.get('message-id'), attempt,
+                    policy.dead_letter)
+
+                self._republish(policy.dead_letter, frame, {
+                    'original-destination': frame.headers.get('destination'),
+                    'failure-reason': ('%s' % (reason,)).replace('\n', ' '),
+                    'failure-attempts': attempt,
+                })
+            else:
+                self.logger.warning(
+                    'Message %s failed %d times, dropping it',
+                    frame.headers.get('message-id'), attempt)
+
+            return self._settle(subscription, frame, 'ACK')
+
+        delay = policy.delay(attempt)
+
+        if republish:
+            self._republish(frame.headers.get('destination'), frame, {
+                RETRY_COUNT: attempt,
+            }, delay=delay)
+            return self._settle(subscription, frame, 'ACK')
+
+        return self._timers.call_later(
+            delay, self._send_ack_frames, 'NACK', frame)
+
+    def _settle(self, subscription, frame, command):
+        if subscription.ack != 'auto':
+            return self._send_ack_frames(command, frame)
+
+    def _republish(self, destination, frame, extra_headers, delay=None):
+        headers = dict(
+            (key, value) for key, value in frame.headers.items()
+            if key not in self.MESSAGE_ONLY_HEADERS)
+        headers.update(extra_headers)
+        headers['destination'] = destination
+
+        body = frame.raw_body
+        if body is None:
+            body = self._protocol._encode(frame.body or '')
+
+        chunk_size = self._chunk_size or frame.chunk_size
+
+        if chunk_size and len(body) > chunk_size:
+            if delay:
+                return self._timers.call_later(
+                    delay, self._send_chunks, body, headers, chunk_size)
+
+            return self._send_chunks(body, headers, chunk_size)
+
+        headers['content-length'] = len(body)
+
+        if delay:
+            return self._timers.call_later(
+                delay, self._send_message_frame, headers, body)
+
+        return self._send_message_frame(headers, body)
+
+    def _send_ack_frames(self, command, frame):
+        if command == 'NACK':
+            frame.nacked = True
+
+        message_ids = frame.message_ids or [frame.headers['message-id']]
+
+        for message_id in message_ids:
+            headers = {
+                'subscription': frame.headers['subscription'],
+                'message-id': message_id
+            }
+
+            result = self._send_frame(command, headers)
+
+        return result
+
+    def _pop_request(self, correlation_id):
+        future, timeout_handler = self._pending_requests.pop(correlation_id)
+
+        if timeout_handler is not None:
+            timeout_handler.cancel()
+
+        return future
+
+    def _request_timeout(self, correlation_id):
+        pending = self._pending_requests.pop(correlation_id, None)
+
+        if pending is not None:
+            pending[0].set_exception(gen.TimeoutError(
+                'Request %s timed out' % correlation_id))
+
+    def _received_reply(self, frame, message):
+        correlation_id = frame.headers.get('correlation-id')
+
+        if correlation_id not in self._pending_requests:
+            self.logger.warning(
+                'Received reply for unknown request: %s', correlation_id)
+            return
+
+        self._pop_request(correlation_id).set_result(frame)
+
+    def _build_io_stream(self):
+        s = self._build_socket()
+
+        if self._ssl_options is not None:
+            return SSLIOStream(s, ssl_options=self._ssl_options)
+
+        return IOStream(s)
+
+    def _build_socket(self):
+        if self._unix_socket is not None:
+            family = socket.AF_UNIX
+        else:
+            family = self._family
+
+        s = socket.socket(family, socket.SOCK_STREAM, 0)
+
+        options = list(self._socket_options)
+        if self._tcp_nodelay and family in (socket.AF_INET, socket.AF_INET6):
+            options.append((socket.IPPROTO_TCP, socket.TCP_NODELAY, 1))
+
+        try:
+            for level, option, value in options:
+                s.setsockopt(level, option, value)
+        except socket.error:
+            s.close()
+            raise
+
+        return s
+
+    def _address(self):
+        if self._unix_socket is not None:
+            return self._unix_socket
+
+        return (self.host, self.port)
+
+    @gen.coroutine
+    def _read_loop(self, stream):
+        try:
+            while True:
+                if self._reading_paused is not None:
+                    yield self._reading_paused
+
+                data = yield stream.read_bytes(65536, partial=True)
+                self._on_data(data)
+        except StreamClosedError:
+            pass
+        except Exception:
+            self.logger.exception('Error handling received data')
+            stream.close()
+
+    def _pause_reading(self):
+        if self._reading_paused is None:
+            self._reading_paused = gen.Future()
+
+    def _resume_reading(self):
+        paused, self._reading_paused = self._reading_paused, None
+
+        if paused is not None and not paused.done():
+            paused.set_result(None)
+
+    def _set_transport_connected(self):
+        self.connected = True
+        self._disconnecting = False
+        self._reconnect_attempts = 0
+        self._protocol.reset()
+
+        # new messages wait in the outbox until the buffered ones are sent
+        self._flushing = self._outbox is not None
+
+    def _on_disconnect_socket(self):
+        self._stop_scheduled_heart_beat()
+        self.connected = False
+        self.disconnected_date = datetime.datetime.now()
+
+        if self._dispatcher is not None:
+            # pending messages can't be acked on a new connection, but
+            # auto-ack ones were already consumed and are still dispatched
+            self._dispatcher.discard(self._needs_ack)
+
+        self._flush_auto_ack_batches()
+
+        if self._disconnecting:
+            self.logger.info('TCP connection end gracefully')
+        else:
+            self.logger.info('TCP connection unexpected end')
+            self._schedule_reconnect()
+
+        if self._on_disconnect:
+            self._on_disconnect()
+
+    def _needs_ack(self, frame):
+        subscription = self._subscriptions.get(
+            frame.headers.get('subscription'))
+
+        return subscription is not None and subscription.ack != 'auto'
+
+    def _schedule_reconnect(self):
+        if self._reconnect_max_attempts == -1 or \
+                self._reconnect_attempts < self._reconnect_max_attempts:
+
+            self._reconnect_attempts += 1
+            self._reconnect_timeout_handler = self._call_later(
+                self._reconnect_timeout, self.connect)
+        else:
+            self.logger.error('All Connection attempts failed')
+
+    def _on_data(self, data):
+        if not data:
+            return
+
+        self._protocol.add_data(data)
+
+        frames = self._protocol.pop_frames()
+        if frames:
+            self._received_frames(frames)
+
+    def _send_frame(self, command, headers={}, body=''):
+        buf = self._protocol.build_frame(command, headers, body)
+        return self._write(buf)
+
+    def _send_message_frame(self, headers, body):
+        buf = self._protocol.build_frame('SEND', headers, body)
+
+        if self._outbox is None:
+            return self._write(buf)
+
+        if self.connected and not self._flushing:
+            try:
+                return self._write(buf)
+            except StreamClosedError:
+                pass
+
+        self._outbox.put(headers, buf)
+
+    @gen.coroutine
+    def _flush_outbox(self):
+        count = 0
+
+        try:
+            # messages sent while a batch is written are flushed next
+            while len(self._outbox):
+                snapshot = self._outbox.snapshot()
+
+                for batch in self._outbox.batches(snapshot):
+                    yield self._write(batch)
+
+                self._outbox.release(snapshot)
+                count += snapshot[0] + snapshot[2]
+        finally:
+            self._flushing = False
+
+        if count:
+            self.logger.info('Flushed %d buffered messages', count)
+
+    def _write(self, buf):
+        return self.stream.write(buf)
+
+    def _close_transport(self):
+        self.stream.close()
+
+    def _call_later(self, delay, callback, *args):
+        return IOLoop.current().add_timeout(delay, callback, *args)
+
+    def _cancel_timer(self, handler):
+        IOLoop.current().remove_timeout(handler)
+
+    def _call_soon(self, callback, *args):
+        IOLoop.current().add_callback(callback, *args)
+
+    def _set_connected(self, connected_frame):
+        heartbeat = connected_frame.headers.get('heart-beat')
+
+        if heartbeat:
+            sx, sy = heartbeat.split(',')
+            sx, sy = int(sx), int(sy)
+
+            if sy:
+                self._set_heart_beat(sy)
+
+    def _set_heart_beat(self, time):
+        self._heart_beat_delta = timedelta(milliseconds=time)
+        self._stop_scheduled_heart_beat()
+
+        self._do_heart_beat()
+
+    def _schedule_heart_beat(self):
+        self._heart_beat_handler = self._call_later(
+            self._heart_beat_delta, self._do_heart_beat)
+
+    def _stop_scheduled_heart_beat(self):
+        if self._heart_beat_handler:
+            self._cancel_timer(self._heart_beat_handler)
+
+        self._heart_beat_handler = None
+
+    def _do_heart_beat(self):
+        self._heart_beat_log()
+
+        try:
+            self._write(self._protocol.HEART_BEAT)
+        except StreamClosedError:
+            self.logger.warning('Heart beat failed: stream is closed')
+
+        self._schedule_heart_beat()
+
+    def _received_frames(self, frames):
+        handlers = self._frame_handlers
+        unhandled = self._received_unhandled_frame
+
+        for frame in frames:
+            handlers.get(frame.command, unhandled)(frame)
+
+        if self._batches and self._dispatcher is None:
+            self._flush_batches()
+
+    def _route_message_frame(self, frame):
+        if self._dispatcher is None:
+            self._received_message_frame(frame)
+        else:
+            self._dispatcher.put(self._subscriptions.get(
+                frame.headers.get('subscription')), frame)
+
+    def _dispatch_message_frame(self, frame):
+        try:
+            self._received_message_frame(frame)
+        except Exception:
+            self.logger.exception('Error handling message')
+            self._close_after_error()
+
+    def _dispatch_batches(self):
+        try:
+            self._flush_batches()
+        except Exception:
+            self.logger.exception('Error handling message batch')
+            self._close_after_error()
+
+    def _close_after_error(self):
+        # as without a dispatcher, the connection is closed so the broker
+        # redelivers every unacked message
+        self._dispatcher.discard(self._needs_ack)
+        self._close_transport()
+
+    def _received_message_frame(self, frame):
+        subscription_header = frame.headers.get('subscription')
+
+        subscription = self._subscriptions.get(subscription_header)
+
+        if not subscription:
+            self.logger.error(
+                'Not found subscription %s', subscription_header)
+            return
+
+        if subscription.dedup is not None:
+            key = frame.headers.get(subscription.dedup_header)
+
+            if key is not None and key in subscription.dedup:
+                self.logger.debug('Skipping duplicated message: %s', key)
+
+                if subscription.ack != 'auto':
+                    self.ack(frame)
+                return
+
+        if subscription.assembler and subscription.assembler.is_chunk(frame):
+            frame = subscription.assembler.add(frame)
+
+            if frame is None:
+                return
+
+        codecs = subscription.codecs or self._codecs
+
+        if codecs is not None:
+            frame.codecs = codecs
+
+        if subscription.batch_callback is not None:
+            self._add_to_batch(subscription, frame)
+            return
+
+        try:
+            if frame.sink is not None:
+                subscription.callback(frame, frame.sink)
+            elif codecs is not None:
+                subscription.callback(frame, frame.payload)
+            else:
+                subscription.callback(frame, frame.body)
+        except Exception as error:
+            if subscription.retry_policy is None:
+                raise
+
+            self.logger.exception('Error handling message')
+            self.reject(frame, error)
+
+        if subscription.dedup is not None and not frame.nacked:
+            self._record_dedup(subscription, frame)
+
+    def _record_dedup(self, subscription, frame):
+        # chunks are recorded once the assembled message was handled, so
+        # all of them can be redelivered after a NACK
+        if frame.message_ids is not None and \
+                subscription.dedup_header == 'message-id':
+            keys = frame.message_ids
+        else:
+            keys = [frame.headers.get(subscription.dedup_header)]
+
+        for key in keys:
+            if key is not None:
+                subscription.dedup.add(key)
+
+    def _add_to_batch(self, subscription, frame):
+        batch = self._batches.get(subscription.id)
+
+        if batch is None:
+            batch = self._batches[subscription.id] = (subscription, [])
+
+        batch[1].append(frame)
+
+        if len(batch[1]) >= subscription.batch_size:
+            del self._batches[subscription.id]
+            self._call_batch_callback(subscription, batch[1])
+
+    def _flush_batches(self):
+        while self._batches:
+            _, (subscription, frames) = self._batches.popitem(last=False)
+            self._call_batch_callback(subscription, frames)
+
+    def _flush_auto_ack_batches(self):
+        batches, self._batches = self._batches, OrderedDict()
+
+        for subscription, frames in batches.values():
+            if subscription.ack != 'auto':
+                continue
+
+            try:
+                self._call_batch_callback(subscription, frames)
+            except Exception:
+                self.logger.exception('Error handling message batch')
+
+    def _call_batch_callback(self, subscription, frames):
+        try:
+            subscription.batch_callback(frames)
+        except Exception as error:
+            if subscription.retry_policy is None:
+                raise
+
+            self.logger.exception('Error handling message batch')
+
+            for frame in frames:
+                self.reject(frame, error)
+
+        if subscription.dedup is None:
+            return
+
+        for frame in frames:
+            if not frame.nacked:
+                self._record_dedup(subscription, frame)
+
+    def _received_error_frame(self, frame):
+        message = frame.headers.get('message')
+
+        self.logger.error('Received error: %s', message)
+        self.logger.debug('Error detail %s', frame.body)
+
+        if self._on_error:
+            self._on_error(
+                StompError(message, frame.body))
+
+    def _received_unhandled_frame(self, frame):
+        self.logger.warn('Received unhandled frame: %s', frame.command)
+
+    def _send_subscribe_frame(self, subscription):
+        headers = {
+            'id': subscription.id,
+            'destination': subscription.destination,
+            'ack': subscription.ack
+        }
+        headers.update(subscription.extra_headers)
+
+        return self._send_frame('SUBSCRIBE', headers)
+
+    def _send_unsubscribe_frame(self, subscription):
+        headers = {
+            'id': subscription.id,
+            'destination': subscription.destination
+        }
+        return self._send_frame('UNSUBSCRIBE', headers)
@@ -0,0 +1,184 @@
+# -*- coding:utf-8 -*-
+import gzip
+import io
+import json
+import zlib
+
+import six
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # pragma: no cover
+    lz4_frame = None
+
+
+class JsonCodec(object):
+
+    content_type = 'application/json'
+
+    def encode(self, value):
+        return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+    def decode(self, data):
+        return json.loads(data.decode('utf-8'))
+
+
+class MsgpackCodec(object):
+
+    content_type = 'application/msgpack'
+
+    def encode(self, value):
+        return msgpack.packb(value, use_bin_type=True)
+
+    def decode(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+
+class ZlibCodec(object):
+
+    content_encoding = 'deflate'
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def encode(self, data):
+        return zlib.compress(data, self.level)
+
+    def decode(self, data):
+        return zlib.decompress(data)
+
+
+class GzipCodec(object):
+
+    content_encoding = 'gzip'
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def encode(self, data):
+        buf = io.BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode='wb',
+                           compresslevel=self.level) as f:
+            f.write(data)
+        return buf.getvalue()
+
+    def decode(self, data):
+        with gzip.GzipFile(fileobj=io.BytesIO(data), mode='rb') as f:
+            return f.read()
+
+
+class Lz4Codec(object):
+
+    content_encoding = 'lz4'
+
+    def encode(self, data):
+        return lz4_frame.compress(data)
+
+    def decode(self, data):
+        return lz4_frame.decompress(data)
+
+
+class CodecRegistry(object):
+
+    def __init__(self, content_type=None, content_encoding=None,
+                 compress_threshold=1024, defaults=True):
+        self.content_type = content_type
+        self.content_encoding = content_encoding
+        self.compress_threshold = compress_threshold
+        self._serializers = {}
+        self._compressors = {}
+
+        if defaults:
+            self.register(JsonCodec())
+            self.register(ZlibCodec())
+            self.register(GzipCodec())
+
+            if msgpack is not None:
+                self.register(MsgpackCodec())
+
+            if lz4_frame is not None:
+                self.register(Lz4Codec())
+
+    def register(self, codec):
+        if getattr(codec, 'content_type', None):
+            self._serializers[codec.content_type] = codec
+
+        if getattr(codec, 'content_encoding', None):
+            self._compressors[codec.content_encoding] = codec
+
+    def serializer(self, content_type):
+        if not content_type:
+            return None
+
+        # ignore parameters like "; charset=utf-8"
+        return self._serializers.get(content_type.split(';', 1)[0].strip())
+
+    def compressor(self, content_encoding):
+        if not content_encoding:
+            return None
+
+        return self._compressors.get(content_encoding)
+
+    def encode(self, body, headers):
+        content_type = headers.get('content-type', self.content_type)
+
+        if not isinstance(body, (six.binary_type, six.text_type)):
+            serializer = self.serializer(content_type)
+
+            if serializer is None:
+                raise ValueError(
+                    'No codec registered for content-type %r' % content_type)
+
+            body = serializer.encode(body)
+            headers['content-type'] = content_type
+
+        if isinstance(body, six.text_type):
+            body = body.encode('utf-8')
+
+        content_encoding = headers.get(
+            'content-encoding', self.content_encoding)
+        compressor = self.compressor(content_encoding)
+
+        if compressor is not None and len(body) >= self.compress_threshold:
+            body = compressor.encode(body)
+            headers['content-encoding'] = content_encoding
+        else:
+            headers.pop('content-encoding', None)
+
+        return body
+
+    def decode(self, data, headers):
+        if data is None:
+            return None
+
+        content_encoding = headers.get('content-encoding')
+
+        if content_encoding:
+            compressor = self.compressor(content_encoding)
+
+            if compressor is None:
+                raise ValueError(
+                    'No codec registered for content-encoding %r' %
+                    content_encoding)
+
+            data = compressor.decode(data)
+
+        content_type = headers.get('content-type')
+        serializer = self.serializer(content_type)
+
+        if serializer is not None:
+            return serializer.decode(data)
+
+        # only text is decoded, other bodies are delivered as bytes
+        if content_type and not content_type.startswith('text/'):
+            return data
+
+        try:
+            return data.decode('utf-8')
+        except UnicodeDecodeError:
+            return data
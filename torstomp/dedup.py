@@ -0,0 +1,111 @@
+# -*- coding:utf-8 -*-
+import hashlib
+import math
+import struct
+import time
+
+from collections import OrderedDict
+
+
+class LRUDedup(object):
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._keys = OrderedDict()
+
+    def __contains__(self, key):
+        if key not in self._keys:
+            return False
+
+        # a hit makes the key the most recently used
+        self._keys.move_to_end(key)
+        return True
+
+    def add(self, key):
+        self._keys[key] = None
+        self._keys.move_to_end(key)
+
+        if len(self._keys) > self.max_size:
+            self._keys.popitem(last=False)
+
+
+class WindowDedup(object):
+
+    def __init__(self, window=60000, max_size=100000):
+        self.window = window / 1000.0
+        self.max_size = max_size
+        self._keys = OrderedDict()
+
+    def __contains__(self, key):
+        self._expire(time.time())
+        return key in self._keys
+
+    def add(self, key):
+        now = time.time()
+        self._expire(now)
+
+        self._keys.pop(key, None)
+        self._keys[key] = now
+
+        if len(self._keys) > self.max_size:
+            self._keys.popitem(last=False)
+
+    def _expire(self, now):
+        limit = now - self.window
+
+        while self._keys:
+            key, timestamp = next(iter(self._keys.items()))
+
+            if timestamp > limit:
+                return
+
+            del self._keys[key]
+
+
+class BloomDedup(object):
+
+    def __init__(self, capacity=1000000, error_rate=0.001):
+        self.capacity = capacity
+        self.size = int(math.ceil(
+            -capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, int(round(
+            self.size / float(capacity) * math.log(2))))
+
+        # two generations keep the last capacity..2*capacity keys
+        self._current = bytearray((self.size + 7) // 8)
+        self._previous = None
+        self._count = 0
+
+    def __contains__(self, key):
+        positions = self._positions(key)
+
+        return self._contains(self._current, positions) or (
+            self._previous is not None and
+            self._contains(self._previous, positions))
+
+    def add(self, key):
+        positions = self._positions(key)
+
+        if self._count >= self.capacity:
+            self._previous = self._current
+            self._current = bytearray(len(self._current))
+            self._count = 0
+
+        for position in positions:
+            self._current[position >> 3] |= 1 << (position & 7)
+
+        self._count += 1
+
+    def _positions(self, key):
+        digest = hashlib.md5(key.encode('utf-8')).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    @staticmethod
+    def _contains(bits, positions):
+        for position in positions:
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+
+        return True
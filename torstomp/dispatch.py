@@ -0,0 +1,202 @@
+# -*- coding:utf-8 -*-
+import heapq
+import itertools
+import logging
+import time
+
+from collections import deque
+
+
+class Dispatcher(object):
+
+    def __init__(self, max_slice=100, time_budget=None, max_pending=10000,
+                 log_name='TorStomp'):
+        self.max_slice = max_slice
+        self.time_budget = time_budget
+        self.max_pending = max_pending
+        self.logger = logging.getLogger(log_name)
+
+        self._handler = None
+        self._call_soon = None
+        self._flush = None
+        self._pause = None
+        self._resume = None
+        self._paused = False
+        self._scheduled = False
+        self._frames = deque()
+
+    def bind(self, handler, call_soon, flush=None, pause=None, resume=None):
+        self._handler = handler
+        self._call_soon = call_soon
+        self._flush = flush
+        self._pause = pause
+        self._resume = resume
+
+    def __len__(self):
+        return len(self._frames)
+
+    def put(self, subscription, frame):
+        self._frames.append(frame)
+        self._schedule()
+        self._check_pending()
+
+    def clear(self):
+        self._frames.clear()
+        self._check_pending()
+
+    def discard(self, predicate):
+        self._frames = deque(
+            frame for frame in self._frames if not predicate(frame))
+        self._check_pending()
+
+    def run_slice(self):
+        self._scheduled = False
+
+        deadline = None
+        if self.time_budget is not None:
+            deadline = time.time() + self.time_budget / 1000.0
+
+        dispatched = 0
+
+        while self._has_pending():
+            self._dispatch(self._next_frame())
+            dispatched += 1
+
+            if self.max_slice is not None and dispatched >= self.max_slice:
+                break
+
+            if deadline is not None and time.time() >= deadline:
+                break
+
+        if self._flush is not None:
+            try:
+                self._flush()
+            except Exception:
+                self.logger.exception('Error flushing message batches')
+
+        self._check_pending()
+
+        if self._has_pending():
+            # leave room for heartbeats and writes before the next slice
+            self._schedule()
+
+    def _check_pending(self):
+        # reading pauses while the queue is full, so TCP slows the broker
+        # down as it did with synchronous dispatch
+        if self.max_pending is None or self._pause is None:
+            return
+
+        full = len(self) >= self.max_pending
+
+        if full and not self._paused:
+            self._paused = True
+            self._pause()
+        elif not full and self._paused:
+            self._paused = False
+            self._resume()
+
+    def _schedule(self):
+        if not self._scheduled:
+            self._scheduled = True
+            self._call_soon(self.run_slice)
+
+    def _has_pending(self):
+        return bool(self._frames)
+
+    def _next_frame(self):
+        return self._frames.popleft()
+
+    def _dispatch(self, frame):
+        try:
+            self._handler(frame)
+        except Exception:
+            self.logger.exception('Error dispatching %r', frame)
+
+
+class _PendingQueue(object):
+
+    def __init__(self, priority, weight):
+        self.priority = priority
+        self.weight = float(weight)
+        self.virtual_time = 0.0
+        self.frames = deque()
+
+
+class FairDispatcher(Dispatcher):
+
+    def __init__(self, max_slice=100, time_budget=None, max_pending=10000,
+                 log_name='TorStomp'):
+        super(FairDispatcher, self).__init__(
+            max_slice=max_slice, time_budget=time_budget,
+            max_pending=max_pending, log_name=log_name)
+
+        self._queues = {}
+        self._active = []
+        self._virtual_time = 0.0
+        self._sequence = itertools.count()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def put(self, subscription, frame):
+        if subscription is None:
+            key, priority, weight = None, 0, 1
+        else:
+            key = subscription.id
+            priority, weight = subscription.priority, subscription.weight
+
+        queue = self._queues.get(key)
+
+        if queue is None:
+            queue = self._queues[key] = _PendingQueue(priority, weight)
+
+        if not queue.frames:
+            queue.virtual_time = max(queue.virtual_time, self._virtual_time)
+            self._activate(queue)
+
+        queue.frames.append(frame)
+        self._size += 1
+        self._schedule()
+        self._check_pending()
+
+    def clear(self):
+        self._queues = {}
+        self._active = []
+        self._virtual_time = 0.0
+        self._size = 0
+        self._check_pending()
+
+    def discard(self, predicate):
+        self._active = []
+        self._size = 0
+
+        for queue in self._queues.values():
+            queue.frames = deque(
+                frame for frame in queue.frames if not predicate(frame))
+
+            if queue.frames:
+                self._size += len(queue.frames)
+                self._activate(queue)
+
+        self._check_pending()
+
+    def _activate(self, queue):
+        heapq.heappush(self._active, (
+            -queue.priority, queue.virtual_time, next(self._sequence), queue))
+
+    def _has_pending(self):
+        return bool(self._active)
+
+    def _next_frame(self):
+        _, _, _, queue = heapq.heappop(self._active)
+        frame = queue.frames.popleft()
+        self._size -= 1
+
+        self._virtual_time = queue.virtual_time
+        queue.virtual_time += 1.0 / queue.weight
+
+        if queue.frames:
+            self._activate(queue)
+
+        return frame
@@ -1,9 +1,42 @@
 class Frame(object):
 
-    def __init__(self, command, headers, body):
+    def __init__(self, command, headers, body=None, raw_body=None,
+                 codecs=None):
         self.command = command
         self.headers = headers
-        self.body = body
+        self.raw_body = raw_body
+        self.codecs = codecs
+        self.sink = None
+        self.message_ids = None
+        self.chunk_size = None
+        self.nacked = False
+        self._body = body
+        self._payload = None
+        self._payload_decoded = False
+
+    @property
+    def body(self):
+        if self._body is None and self.raw_body:
+            self._body = self.raw_body.decode('utf-8')
+
+        return self._body
+
+    @body.setter
+    def body(self, value):
+        self._body = value
+
+    @property
+    def payload(self):
+        if not self._payload_decoded:
+            if self.codecs is None or self.raw_body is None:
+                self._payload = self.body
+            else:
+                self._payload = self.codecs.decode(
+                    self.raw_body or None, self.headers)
+
+            self._payload_decoded = True
+
+        return self._payload
 
     def __repr__(self):
         return '<Frame: %s>' % self.command
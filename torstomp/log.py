@@ -0,0 +1,74 @@
+# -*- coding:utf-8 -*-
+import atexit
+import logging
+
+
+class SampledLog(object):
+
+    def __init__(self, logger, message, every=100, level=logging.DEBUG):
+        self.logger = logger
+        self.message = message
+        self.every = every
+        self.level = level
+        self.count = 0
+
+    def __call__(self):
+        # one log record for every `every` events, starting with the first
+        self.count += 1
+
+        if (self.count - 1) % self.every == 0 and \
+                self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, self.message, self.count)
+
+
+_listeners = {}
+
+
+def start_background_logging(log_name='TorStomp'):
+    from logging.handlers import QueueHandler, QueueListener
+    from queue import Queue
+
+    if log_name in _listeners:
+        return _listeners[log_name][0]
+
+    logger = logging.getLogger(log_name)
+
+    handlers = logger.handlers
+    if not handlers and logger.propagate:
+        handlers = logging.getLogger().handlers
+
+    handlers = list(handlers)
+    if not handlers and logging.lastResort is not None:
+        handlers = [logging.lastResort]
+
+    # handlers run on the listener thread, the caller only enqueues
+    queue = Queue(-1)
+    listener = QueueListener(queue, *handlers, respect_handler_level=True)
+
+    _listeners[log_name] = (listener, logger.handlers, logger.propagate)
+
+    logger.handlers = [QueueHandler(queue)]
+    logger.propagate = False
+    listener.start()
+
+    return listener
+
+
+def stop_background_logging(log_name='TorStomp'):
+    entry = _listeners.pop(log_name, None)
+
+    if entry is None:
+        return
+
+    listener, handlers, propagate = entry
+    listener.stop()
+
+    logger = logging.getLogger(log_name)
+    logger.handlers = handlers
+    logger.propagate = propagate
+
+
+@atexit.register
+def _stop_all():
+    for log_name in list(_listeners):
+        stop_background_logging(log_name)
@@ -0,0 +1,221 @@
+# -*- coding:utf-8 -*-
+import mmap
+import os
+import struct
+
+from collections import deque
+from itertools import islice
+
+from torstomp.chunking import CHUNK_INDEX
+from torstomp.errors import OutboxFullError
+
+# record layout: key length, frame length, key, frame
+_RECORD_HEADER = struct.Struct('>HI')
+
+
+class Outbox(object):
+
+    def __init__(self, max_memory=1024 * 1024, path=None,
+                 max_disk=64 * 1024 * 1024, id_header='message-id'):
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.path = path
+        self.id_header = id_header
+
+        self._memory = deque()
+        self._memory_size = 0
+        self._disk_size = 0
+        self._disk_records = 0
+        self._keys = set()
+
+        if path and os.path.exists(path):
+            self._load_segment()
+
+    def __len__(self):
+        return len(self._memory) + self._disk_records
+
+    def put(self, headers, buf):
+        key = self._key(headers)
+
+        if key is not None:
+            if key in self._keys:
+                return False
+
+            self._keys.add(key)
+
+        if not self._disk_size and \
+                self._memory_size + len(buf) <= self.max_memory:
+            self._memory.append((key, buf))
+            self._memory_size += len(buf)
+            return True
+
+        try:
+            self._append_segment(key, buf)
+        except OutboxFullError:
+            self._keys.discard(key)
+            raise
+
+        return True
+
+    def snapshot(self):
+        # the records buffered so far, for batches() and release()
+        return (len(self._memory), self._disk_size, self._disk_records)
+
+    def batches(self, snapshot=None):
+        memory_count, disk_size, _ = snapshot or self.snapshot()
+
+        if memory_count:
+            yield b''.join(
+                buf for _, buf in islice(self._memory, memory_count))
+
+        if not disk_size:
+            return
+
+        with open(self.path, 'rb') as f:
+            segment = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            try:
+                batch = []
+                batch_size = 0
+
+                for _, start, end in self._segment_records(
+                        segment, disk_size):
+                    if batch and batch_size + end - start > self.max_memory:
+                        yield b''.join(batch)
+                        batch = []
+                        batch_size = 0
+
+                    batch.append(segment[start:end])
+                    batch_size += end - start
+
+                if batch:
+                    yield b''.join(batch)
+            finally:
+                segment.close()
+
+    def release(self, snapshot):
+        # drop the records of a snapshot, keeping the ones put since
+        memory_count, disk_size, disk_records = snapshot
+
+        for _ in range(memory_count):
+            key, buf = self._memory.popleft()
+            self._memory_size -= len(buf)
+            self._keys.discard(key)
+
+        if disk_size:
+            self._release_segment(disk_size)
+            self._disk_size -= disk_size
+            self._disk_records -= disk_records
+
+    def clear(self):
+        self._memory.clear()
+        self._memory_size = 0
+        self._keys.clear()
+
+        if self._disk_size:
+            os.remove(self.path)
+
+        self._disk_size = 0
+        self._disk_records = 0
+
+    def _key(self, headers):
+        key = headers.get(self.id_header)
+
+        if key is None:
+            return None
+
+        if CHUNK_INDEX in headers:
+            return '%s#%s' % (key, headers[CHUNK_INDEX])
+
+        return '%s' % key
+
+    def _release_segment(self, offset):
+        with open(self.path, 'rb') as f:
+            segment = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            try:
+                for key, _, _ in self._segment_records(segment, offset):
+                    self._keys.discard(key)
+
+                tail = segment[offset:self._disk_size]
+            finally:
+                segment.close()
+
+        if not tail:
+            os.remove(self.path)
+            return
+
+        temporary = self.path + '.tmp'
+
+        with open(temporary, 'wb') as f:
+            f.write(tail)
+
+        os.rename(temporary, self.path)
+
+    def _append_segment(self, key, buf):
+        encoded_key = (key or '').encode('utf-8')
+        size = _RECORD_HEADER.size + len(encoded_key) + len(buf)
+
+        if not self.path or self._disk_size + size > self.max_disk:
+            raise OutboxFullError('Outbox is full')
+
+        with open(self.path, 'ab') as f:
+            f.write(_RECORD_HEADER.pack(len(encoded_key), len(buf)))
+            f.write(encoded_key)
+            f.write(buf)
+
+        self._disk_size += size
+        self._disk_records += 1
+
+    def _load_segment(self):
+        size = os.path.getsize(self.path)
+        offset = 0
+
+        if size:
+            with open(self.path, 'rb') as f:
+                segment = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+                try:
+                    offset = self._load_records(segment, size)
+                finally:
+                    segment.close()
+
+        self._disk_size = offset
+
+        if offset < size:
+            # drop an incomplete record left by an interrupted write
+            with open(self.path, 'ab') as f:
+                f.truncate(offset)
+
+    def _load_records(self, segment, size):
+        offset = 0
+
+        while offset + _RECORD_HEADER.size <= size:
+            key_size, frame_size = _RECORD_HEADER.unpack_from(segment, offset)
+            key_start = offset + _RECORD_HEADER.size
+            end = key_start + key_size + frame_size
+
+            if end > size:
+                break
+
+            key = segment[key_start:key_start + key_size].decode('utf-8')
+            if key:
+                self._keys.add(key)
+
+            self._disk_records += 1
+            offset = end
+
+        return offset
+
+    def _segment_records(self, segment, size):
+        offset = 0
+
+        while offset < size:
+            key_size, frame_size = _RECORD_HEADER.unpack_from(segment, offset)
+            key_start = offset + _RECORD_HEADER.size
+            start = key_start + key_size
+            offset = start + frame_size
+
+            key = segment[key_start:start].decode('utf-8') or None
+
+            yield key, start, offset
@@ -1,80 +1,168 @@
 # -*- coding:utf-8 -*-
 import logging
-import sys
-import six
+import os
+import re
 
 from torstomp.frame import Frame
+from torstomp.log import SampledLog
 
-PYTHON3 = sys.hexversion >= 0x03000000
+try:
+    text_type = unicode
+except NameError:
+    text_type = str
 
-if not PYTHON3:
-    import codecs
-    utf8_decoder = codecs.lookup('utf-8')
+DIGITS = re.compile(r'[0-9]+\Z')
 
 
-class StompProtocol(object):
+class PyStompProtocol(object):
 
     HEART_BEAT = b'\n'
     EOF = b'\x00'
 
     def __init__(self, log_name='StompProtocol'):
         self._pending_parts = []
+        self._expected_size = None
         self._frames_ready = []
         self.logger = logging.getLogger(log_name)
+        self._heart_beat_log = SampledLog(
+            self.logger, 'Heartbeats received: %d')
 
     def _decode(self, byte_data):
         try:
-            if isinstance(byte_data, six.binary_type):
+            if isinstance(byte_data, bytes):
                 return byte_data.decode('utf-8')
 
             return byte_data
         except UnicodeDecodeError:
-            logging.error(u"string was: {}".format(byte_data))
+            self.logger.error('string was: %r', byte_data)
             raise
 
     def _encode(self, value):
-        if isinstance(value, six.text_type):
+        if isinstance(value, text_type):
             return value.encode('utf-8')
 
         return value
 
     def reset(self):
         self._pending_parts = []
+        self._expected_size = None
         self._frames_ready = []
 
     def add_data(self, data):
-        if not self._pending_parts and data.startswith(self.HEART_BEAT):
-            self._recv_heart_beat()
-            data = data[1:]
+        start = 0
+        end = len(data)
+
+        while start < end:
+            if self._expected_size is not None:
+                start = self._add_sized_data(data, start)
+                continue
+
+            if not self._pending_parts:
+                start = self._scan_frames(data, start)
+
+                while data.startswith(self.HEART_BEAT, start):
+                    self._recv_heart_beat()
+                    start += 1
+
+                if start == end:
+                    return
+
+            eof = data.find(self.EOF, start)
+
+            if eof == -1:
+                self._pending_parts.append(data[start:] if start else data)
+                return
+
+            if self._pending_parts:
+                self._pending_parts.append(data[start:eof])
+                frame_data = b''.join(self._pending_parts)
+                self._pending_parts = []
+            else:
+                frame_data = data[start:eof]
+
+            start = eof + 1
+
+            headers_end = frame_data.find(b'\n\n')
+            expected_size = self._frame_size(frame_data, headers_end)
+
+            if expected_size is not None and len(frame_data) < expected_size:
+                # the NULL octet belongs to a body with content-length
+                self._pending_parts = [frame_data, self.EOF]
+                self._expected_size = expected_size - len(frame_data) - 1
+                continue
+
+            self._proccess_frame(frame_data, headers_end)
+
+    def _add_sized_data(self, data, start):
+        if len(data) - start <= self._expected_size:
+            self._pending_parts.append(data[start:] if start else data)
+            self._expected_size -= len(data) - start
+            return len(data)
+
+        stop = start + self._expected_size
+        self._pending_parts.append(data[start:stop])
+
+        frame_data = b''.join(self._pending_parts)
+        self._pending_parts = []
+        self._expected_size = None
+        self._proccess_frame(frame_data, frame_data.find(b'\n\n'))
+
+        if data.startswith(self.EOF, stop):
+            stop += 1
+
+        return stop
+
+    def _scan_frames(self, data, start):
+        return start
+
+    def _frame_size(self, data, headers_end):
+        if headers_end == -1:
+            return None
+
+        start = data.find(b'\ncontent-length:', 0, headers_end)
+
+        if start == -1:
+            return None
+
+        start += len(b'\ncontent-length:')
+        end = data.find(b'\n', start, headers_end + 1)
+        length = data[start:end]
 
-            if data:
-                return self.add_data(data)
+        if not length.isdigit():
+            return None
 
-        before_eof, sep, after_eof = data.partition(self.EOF)
+        return headers_end + 2 + int(length)
 
-        if before_eof:
-            self._pending_parts.append(before_eof)
+    def _proccess_frame(self, data, headers_end):
+        if headers_end == -1:
+            lines = self._decode(data).rstrip('\n').split('\n')
+            body = b''
+        else:
+            lines = self._decode(data[:headers_end]).split('\n')
+            body = data[headers_end + 2:]
 
-        if sep:
-            frame_data = b''.join(self._pending_parts)
-            self._pending_parts = []
-            self._proccess_frame(frame_data)
+        headers = {}
+        length = None
 
-        if after_eof:
-            self.add_data(after_eof)
+        for line in lines[1:]:
+            key, _, value = line.partition(':')
+            headers[key] = value
 
-    def _proccess_frame(self, data):
-        data = self._decode(data)
-        command, remaing = data.split('\n', 1)
+            # the first content-length is the one used for framing
+            if key == 'content-length' and length is None:
+                length = value
 
-        raw_headers, remaing = remaing.split('\n\n', 1)
-        headers = dict([l.split(':', 1) for l in raw_headers.split('\n')])
-        body = remaing if remaing else None
+        if length is not None and DIGITS.match(length):
+            length = int(length)
 
-        self._frames_ready.append(Frame(command, headers=headers, body=body))
+            if length < len(body):
+                body = body[:length]
+
+        self._frames_ready.append(
+            Frame(lines[0], headers=headers, raw_body=body))
 
     def _recv_heart_beat(self):
-        self.logger.debug('Heartbeat received')
+        self._heart_beat_log()
 
     def build_frame(self, command, headers={}, body=''):
         lines = [command, '\n']
@@ -93,3 +181,50 @@ class StompProtocol(object):
         self._frames_ready = []
 
         return frames
+
+
+try:
+    if os.environ.get('TORSTOMP_NO_SPEEDUPS'):
+        raise ImportError('speedups disabled by TORSTOMP_NO_SPEEDUPS')
+
+    from torstomp import _speedups
+except ImportError:
+    _speedups = None
+
+
+class CStompProtocol(PyStompProtocol):
+
+    def _scan_frames(self, data, start):
+        # every complete frame from start in one call, the rest is left
+        # to the pure Python loop
+        try:
+            frames, heart_beats, start = _speedups.scan_frames(
+                data, start, Frame)
+        except UnicodeDecodeError:
+            self.logger.error('string was: %r', data)
+            raise
+
+        for _ in range(heart_beats):
+            self._recv_heart_beat()
+
+        self._frames_ready.extend(frames)
+        return start
+
+    def _proccess_frame(self, data, headers_end):
+        try:
+            command, headers, body = _speedups.parse_frame(data, headers_end)
+        except UnicodeDecodeError:
+            self.logger.error('string was: %r', data)
+            raise
+
+        self._frames_ready.append(
+            Frame(command, headers=headers, raw_body=body))
+
+    def build_frame(self, command, headers={}, body=''):
+        return _speedups.build_frame(command, headers, body)
+
+
+if _speedups is not None:
+    StompProtocol = CStompProtocol
+else:
+    StompProtocol = PyStompProtocol
@@ -0,0 +1,69 @@
+# -*- coding:utf-8 -*-
+import socket
+
+from torstomp.errors import StompError
+from torstomp.protocol import StompProtocol
+
+VERSION = '1.1'
+RECEIPT_ID = 'torstomp-publish-once'
+
+
+def publish_once(destination, body='', headers={}, host='localhost',
+                 port=61613, connect_headers={}, send_content_length=True,
+                 codecs=None, receipt=True, timeout=10000):
+    # connect, send one message and disconnect with a blocking socket,
+    # without tornado or an IOLoop
+    protocol = StompProtocol(log_name='TorStomp')
+
+    connect_headers = dict(connect_headers)
+    connect_headers['accept-version'] = VERSION
+
+    headers = dict(headers)
+    headers['destination'] = destination
+
+    if codecs is not None and body is not None and body != '':
+        body = codecs.encode(body, headers)
+        send_content_length = send_content_length or \
+            'content-encoding' in headers
+
+    if body:
+        body = protocol._encode(body)
+
+        if send_content_length:
+            headers['content-length'] = len(body)
+
+    if receipt:
+        headers['receipt'] = RECEIPT_ID
+
+    sock = socket.create_connection((host, port), timeout / 1000.0)
+
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.sendall(protocol.build_frame('CONNECT', connect_headers))
+        _wait_for(sock, protocol, 'CONNECTED')
+
+        sock.sendall(protocol.build_frame('SEND', headers, body or ''))
+
+        if receipt:
+            _wait_for(sock, protocol, 'RECEIPT')
+
+        sock.sendall(protocol.build_frame('DISCONNECT'))
+    finally:
+        sock.close()
+
+
+def _wait_for(sock, protocol, command):
+    while True:
+        for frame in protocol.pop_frames():
+            if frame.command == command:
+                return frame
+
+            if frame.command == 'ERROR':
+                raise StompError(frame.headers.get('message'), frame.body)
+
+        data = sock.recv(65536)
+
+        if not data:
+            raise socket.error('Connection closed waiting for %s' % command)
+
+        protocol.add_data(data)
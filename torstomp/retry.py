@@ -0,0 +1,52 @@
+# -*- coding:utf-8 -*-
+from collections import OrderedDict
+
+RETRY_COUNT = 'torstomp-retry-count'
+
+
+class RetryPolicy(object):
+
+    def __init__(self, max_attempts=5, backoff=1000, backoff_factor=2,
+                 max_backoff=60000, dead_letter=None, republish=False,
+                 count_header=None, key_header='message-id',
+                 max_tracked=10000):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.dead_letter = dead_letter
+        self.republish = republish
+        self.count_header = count_header
+        self.key_header = key_header
+        self.max_tracked = max_tracked
+
+        self._attempts = OrderedDict()
+
+    def attempt(self, frame, republish=False):
+        count_header = self.count_header
+
+        # republished copies get a new message-id from the broker
+        if count_header is None and (self.republish or republish):
+            count_header = RETRY_COUNT
+
+        if count_header is not None:
+            return int(frame.headers.get(count_header, 0)) + 1
+
+        key = frame.headers.get(self.key_header)
+        attempt = self._attempts.pop(key, 0) + 1
+        self._attempts[key] = attempt
+
+        if len(self._attempts) > self.max_tracked:
+            self._attempts.popitem(last=False)
+
+        return attempt
+
+    def forget(self, frame):
+        self._attempts.pop(frame.headers.get(self.key_header), None)
+
+    def exhausted(self, attempt):
+        return attempt >= self.max_attempts
+
+    def delay(self, attempt):
+        delay = self.backoff * self.backoff_factor ** (attempt - 1)
+        return min(delay, self.max_backoff)
@@ -1,8 +1,21 @@
 class Subscription(object):
 
-    def __init__(self, destination, id, ack, extra_headers, callback):
+    def __init__(self, destination, id, ack, extra_headers, callback,
+                 codecs=None, assembler=None,
+                 dedup=None, dedup_header='message-id',
+                 priority=0, weight=1, batch_callback=None,
+                 batch_size=100, retry_policy=None):
         self.destination = destination
         self.id = id
         self.ack = ack
         self.extra_headers = extra_headers
         self.callback = callback
+        self.codecs = codecs
+        self.assembler = assembler
+        self.dedup = dedup
+        self.dedup_header = dedup_header
+        self.priority = priority
+        self.weight = weight
+        self.batch_callback = batch_callback
+        self.batch_size = batch_size
+        self.retry_policy = retry_policy
@@ -0,0 +1,237 @@
+# -*- coding:utf-8 -*-
+import logging
+import multiprocessing
+import os
+import signal
+import time
+
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+from torstomp.client import TorStomp
+
+try:
+    from queue import Empty
+except ImportError:  # pragma: no cover
+    from Queue import Empty
+
+if hasattr(multiprocessing, 'get_context'):
+    # callbacks are usually closures, so workers must be forked
+    _mp = multiprocessing.get_context('fork')
+else:  # pragma: no cover
+    _mp = multiprocessing
+
+
+class ConsumerSpec(object):
+
+    def __init__(self, destination, callback, ack='auto', prefetch=None,
+                 extra_headers=None):
+        self.destination = destination
+        self.callback = callback
+        self.ack = ack
+        self.prefetch = prefetch
+        self.extra_headers = extra_headers or {}
+
+
+class _WorkerMetrics(object):
+
+    def __init__(self, destinations):
+        self.received = dict((destination, 0) for destination in destinations)
+        self.errors = dict((destination, 0) for destination in destinations)
+
+    def snapshot(self):
+        return {
+            'received': dict(self.received),
+            'errors': dict(self.errors),
+        }
+
+
+class Supervisor(object):
+
+    def __init__(self, specs, concurrency=None, client_factory=None,
+                 client_kwargs=None, prefetch_header='activemq.prefetchSize',
+                 metrics_interval=1000, poll_interval=0.5,
+                 log_name='TorStomp.supervisor'):
+        self.specs = specs
+        self.concurrency = concurrency or multiprocessing.cpu_count()
+        self.logger = logging.getLogger(log_name)
+
+        self._client_factory = client_factory or TorStomp
+        self._client_kwargs = client_kwargs or {}
+        self._prefetch_header = prefetch_header
+        self._metrics_interval = metrics_interval
+        self._poll_interval = poll_interval
+
+        self._workers = {}
+        self._worker_metrics = {}
+        self._retired_metrics = self._empty_metrics()
+        self._metrics_queue = None
+        self._stopping = False
+        self.restarts = 0
+
+    def start(self):
+        self._stopping = False
+        self._metrics_queue = _mp.Queue()
+
+        for index in range(self.concurrency):
+            self._start_worker(index)
+
+    def run(self):
+        previous_handler = self._set_sigterm_handler(self._handle_sigterm)
+
+        try:
+            self.start()
+
+            while not self._stopping:
+                self.poll()
+                time.sleep(self._poll_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+            if previous_handler is not None:
+                self._set_sigterm_handler(previous_handler)
+
+    def poll(self):
+        self._drain_metrics()
+
+        for index, process in list(self._workers.items()):
+            if process.is_alive() or self._stopping:
+                continue
+
+            self.logger.warning(
+                'Worker %d (pid %s) exited with code %s, restarting',
+                index, process.pid, process.exitcode)
+
+            self._retire_metrics(index)
+            self.restarts += 1
+            self._start_worker(index)
+
+    def stop(self):
+        self._stopping = True
+
+        for process in self._workers.values():
+            if process.is_alive():
+                process.terminate()
+
+        for process in self._workers.values():
+            process.join()
+
+        self._drain_metrics()
+        self._workers = {}
+
+    def _handle_sigterm(self, signum, frame):
+        # run() stops the workers once the current poll returns
+        self.logger.info('Received SIGTERM, stopping workers')
+        self._stopping = True
+
+    def _set_sigterm_handler(self, handler):
+        try:
+            return signal.signal(signal.SIGTERM, handler)
+        except ValueError:
+            # signal handlers can only be set from the main thread
+            return None
+
+    def metrics(self):
+        self._drain_metrics()
+
+        totals = self._empty_metrics()
+        snapshots = [self._retired_metrics] + \
+            list(self._worker_metrics.values())
+
+        for snapshot in snapshots:
+            for name in ('received', 'errors'):
+                for destination, value in snapshot[name].items():
+                    totals[name][destination] += value
+
+        totals['workers'] = len(
+            [p for p in self._workers.values() if p.is_alive()])
+        totals['restarts'] = self.restarts
+
+        return totals
+
+    def _empty_metrics(self):
+        return _WorkerMetrics(
+            [spec.destination for spec in self.specs]).snapshot()
+
+    def _start_worker(self, index):
+        process = _mp.Process(
+            target=self._worker_main, args=(index, self._metrics_queue))
+        process.daemon = True
+        process.start()
+
+        self._workers[index] = process
+        self.logger.info('Worker %d started (pid %s)', index, process.pid)
+
+    def _retire_metrics(self, index):
+        snapshot = self._worker_metrics.pop(index, None)
+
+        if snapshot is None:
+            return
+
+        for name in ('received', 'errors'):
+            for destination, value in snapshot[name].items():
+                self._retired_metrics[name][destination] += value
+
+    def _drain_metrics(self):
+        if self._metrics_queue is None:
+            return
+
+        while True:
+            try:
+                index, pid, snapshot = self._metrics_queue.get_nowait()
+            except Empty:
+                return
+
+            process = self._workers.get(index)
+
+            # ignore late reports from a worker that was already replaced
+            if process is None or process.pid == pid:
+                self._worker_metrics[index] = snapshot
+
+    def _worker_main(self, index, metrics_queue):
+        # terminate() must kill the worker, not run the parent's handler
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+        metrics = _WorkerMetrics([spec.destination for spec in self.specs])
+        client = self._build_client(metrics)
+
+        def report():
+            metrics_queue.put((index, os.getpid(), metrics.snapshot()))
+
+        io_loop = IOLoop.current()
+        PeriodicCallback(report, self._metrics_interval).start()
+        io_loop.add_callback(client.connect)
+        io_loop.start()
+
+    def _build_client(self, metrics):
+        client = self._client_factory(**self._client_kwargs)
+
+        for spec in self.specs:
+            extra_headers = dict(spec.extra_headers)
+
+            if spec.prefetch is not None:
+                extra_headers[self._prefetch_header] = spec.prefetch
+
+            client.subscribe(
+                spec.destination, ack=spec.ack, extra_headers=extra_headers,
+                callback=self._wrap_callback(spec, metrics, client))
+
+        return client
+
+    def _wrap_callback(self, spec, metrics, client):
+        def callback(frame, message):
+            metrics.received[spec.destination] += 1
+
+            try:
+                spec.callback(frame, message)
+            except Exception:
+                metrics.errors[spec.destination] += 1
+                self.logger.exception(
+                    'Error handling message from %s', spec.destination)
+
+                # let the broker redeliver it
+                if spec.ack != 'auto':
+                    client.nack(frame)
+
+        return callback
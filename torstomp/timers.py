@@ -0,0 +1,111 @@
+# -*- coding:utf-8 -*-
+import heapq
+import itertools
+import logging
+import time
+
+from datetime import timedelta
+
+
+class TimerHandle(object):
+
+    def __init__(self, queue, deadline, callback, args):
+        self.deadline = deadline
+        self.cancelled = False
+        self._queue = queue
+        self._callback = callback
+        self._args = args
+
+    def cancel(self):
+        if not self.cancelled:
+            self.cancelled = True
+            self._callback = self._args = None
+            self._queue._cancel()
+
+
+class TimerQueue(object):
+
+    def __init__(self, call_later, cancel_timer, log_name='TorStomp'):
+        self.logger = logging.getLogger(log_name)
+
+        self._call_later = call_later
+        self._cancel_timer = cancel_timer
+        self._heap = []
+        self._sequence = itertools.count()
+        self._cancelled = 0
+        self._armed_deadline = None
+        self._armed_handler = None
+
+    def __len__(self):
+        return len(self._heap) - self._cancelled
+
+    def call_later(self, delay, callback, *args):
+        # deadlines use the monotonic clock, wall clock steps don't move them
+        return self.call_at(
+            time.monotonic() + delay / 1000.0, callback, *args)
+
+    def call_at(self, deadline, callback, *args):
+        handle = TimerHandle(self, deadline, callback, args)
+        heapq.heappush(self._heap, (deadline, next(self._sequence), handle))
+
+        if self._armed_deadline is None or deadline < self._armed_deadline:
+            self._arm()
+
+        return handle
+
+    def _arm(self):
+        if self._armed_handler is not None:
+            self._cancel_timer(self._armed_handler)
+            self._armed_handler = None
+            self._armed_deadline = None
+
+        self._compact()
+
+        if not self._heap:
+            return
+
+        deadline = self._heap[0][0]
+        delay = max(0.0, deadline - time.monotonic())
+
+        self._armed_deadline = deadline
+        self._armed_handler = self._call_later(
+            timedelta(seconds=delay), self._run)
+
+    def _run(self):
+        self._armed_handler = None
+        self._armed_deadline = None
+
+        now = time.monotonic()
+
+        while self._heap and self._heap[0][0] <= now:
+            _, _, handle = heapq.heappop(self._heap)
+
+            if handle.cancelled:
+                self._cancelled -= 1
+                continue
+
+            callback, args = handle._callback, handle._args
+            handle.cancelled = True
+            handle._callback = handle._args = None
+
+            try:
+                callback(*args)
+            except Exception:
+                self.logger.exception('Error running timer callback')
+
+        self._arm()
+
+    def _cancel(self):
+        self._cancelled += 1
+        self._compact()
+
+    def _compact(self):
+        # drop cancelled timers once they are most of the heap
+        if self._cancelled and self._cancelled * 2 >= len(self._heap):
+            self._heap = [item for item in self._heap if not item[2].cancelled]
+            heapq.heapify(self._heap)
+            self._cancelled = 0
+
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+            self._cancelled -= 1